@@ -1,9 +1,15 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from controller import course_search
+from cache import response_cache
+from sessions import session_store
+import hashlib
+import json
 import os
+import secrets
+import sys
 import uvicorn
 
 app = FastAPI()
@@ -16,53 +22,231 @@ templates = Jinja2Templates(directory="templates")
 
 courses_controller = course_search(courses_data_path='data/rutgers_courses.json')
 
-your_location = None
-college_distances = None
+# Per-user location sessions, identified by a cookie (or a 'sessionToken' field for non-browser clients)
+SESSION_COOKIE = 'session_id'
+sessions = session_store(
+    ttl=int(os.environ.get("SESSION_TTL", 86400)),
+    max_size=int(os.environ.get("SESSION_MAX_SIZE", 10000)),
+    secret=os.environ.get("SESSION_SECRET")
+)
+
+# Search responses are fully determined by the loaded data, so cache them per data version
+search_cache = response_cache(max_size=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)))
+
+async def get_session(request: Request, data=None):
+    """
+    Get the location session for a request.
+
+    Looks up the token from the request data or cookie. If this worker has not seen the token,
+    the session is rebuilt from the grid cell embedded in it using the shared distance cache,
+    but only if the token's signature is valid and it has not expired.
+
+    Returns:
+        dict: Session with 'cell' and 'college_distances', or None if the user has not saved a location.
+    """
+    token = (data or {}).get('sessionToken') or request.cookies.get(SESSION_COOKIE)
+    if not token:
+        return None
+
+    session = sessions.get(token)
+    if session is None:
+        cell = sessions.token_cell(token)
+        if cell is None:
+            return None
+
+        location = courses_controller.distances_cache.cell_center(cell)
+        session = {
+            'cell': cell,
+            'college_distances': await courses_controller.get_all_college_distances(location)
+        }
+        sessions.set(token, session)
+
+    return session
+
+def location_key(session):
+    """
+    Identify the distances a search response is computed from, for the response cache key.
+
+    Refine mode updates a cell's distances after responses for it may already be cached, so the
+    key covers the distance values themselves and not just the grid cell.
+
+    Returns:
+        tuple: (cell, distances) of the session, or None without a location.
+    """
+    if not session:
+        return None
+    return (session['cell'], tuple(session['college_distances'].items()))
+
+async def read_search_params(request: Request):
+    """Read search parameters from the query string (GET) or the JSON body (POST)."""
+    if request.method == 'GET':
+        return dict(request.query_params)
+    return await request.json()
+
+def cached_response(request: Request, entry, fields=None):
+    """
+    Return a cached (body, etag) entry, or 304 if the client already has it.
+
+    Args:
+        request (Request): The request being answered.
+        entry (tuple): (body bytes, etag) from the response cache.
+        fields (dict, optional): Request-specific fields added to the cached JSON object, with an
+            ETag that covers them. Defaults to None.
+    """
+    body, etag = entry
+    if fields:
+        prefix = json.dumps(fields, ensure_ascii=False, separators=(',', ':')).encode('utf-8')[:-1] + b','
+        body = prefix + body[1:]
+        etag = f'"{hashlib.sha1(etag.encode("utf-8") + prefix).hexdigest()}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+@app.on_event("startup")
+async def start_data_watcher():
+    """Reload the course and equivalency data in the background whenever their files change."""
+    courses_controller.start_data_watcher()
+
+@app.on_event("shutdown")
+async def close_controller():
+    """Close pooled HTTP sessions and the search thread pool when the worker shuts down."""
+    await courses_controller.close()
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint for monitoring and load balancers."""
-    return {"status": "healthy", "message": "Rutgers Course Finder is running"}
+    return {
+        "status": "healthy",
+        "message": "Rutgers Course Finder is running",
+        "caches": {**courses_controller.cache_stats(), 'responses': search_cache.stats()},
+        "sessions": len(sessions),
+        "data_version": courses_controller.data_version
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics for this worker, in the text exposition format.
+
+    Reports per-stage latency histograms (embedding, vector query, detail extraction,
+    equivalency join, distance fetch), error counts per stage, and cache hit ratios.
+    Each gunicorn worker keeps its own numbers.
+    """
+    body = courses_controller.metrics.render(
+        caches={**courses_controller.cache_stats(), 'responses': search_cache.stats()},
+        gauges={
+            'sessions': ('Location sessions held by this worker.', len(sessions)),
+            'data_version': ('Version of the loaded data, incremented on every reload.', courses_controller.data_version)
+        }
+    )
+    return Response(content=body, media_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.post("/admin/reload")
+async def reload_data(request: Request, force: bool = False):
+    """
+    Reload the course and equivalency data without restarting.
+
+    Requires the ADMIN_TOKEN environment variable, sent back in the X-Admin-Token header.
+    Only the worker that handles the request reloads right away; the others pick up
+    changed files through their file watcher.
+
+    Returns:
+        JSON response saying whether new data was loaded, and the current data version
+    """
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if not admin_token or not secrets.compare_digest(request.headers.get('x-admin-token', ''), admin_token):
+        return JSONResponse({'status': 'error', 'message': 'Forbidden'}, status_code=403)
+
+    try:
+        reloaded = await courses_controller.reload_data(force)
+    except Exception as e:
+        return {
+            'status': 'error',
+            'message': f'An error occurred: {str(e)}'
+        }
+
+    return {
+        'status': 'success',
+        'reloaded': reloaded,
+        'dataVersion': courses_controller.data_version
+    }
+
+@app.get("/terms")
+async def list_terms():
+    """
+    List the terms and campuses that can be searched, e.g. '2025-9-NB'.
+
+    Pass one as the 'term' parameter of /search_by_code, /suggest_course_code or
+    /search_by_professor; without it those search the default course data.
+    """
+    return {
+        'status': 'success',
+        'defaultTerm': courses_controller.default_term,
+        'terms': courses_controller.available_terms()
+    }
+
 
 @app.get("/", response_class=HTMLResponse)
 async def search_page(request: Request):
     return templates.TemplateResponse("main.html", {"request": request})
 
 @app.post("/save_location")
-async def save_location(request: Request):
+async def save_location(request: Request, response: Response):
     """
     Save user's current location.
     
     Expects JSON payload with latitude and longitude.
-    Updates global your_location variable.
+    Stores the location and its college distances in the user's session, creating
+    the session (and its cookie) if needed.
     
     Returns:
-        JSON response with location status and coordinates
+        JSON response with location status, coordinates and session token
     """
 
     data = await request.json()
     latitude = data.get('latitude')
     longitude = data.get('longitude')
-    global your_location
-    your_location = (latitude, longitude)
 
-    global college_distances
-    college_distances = await courses_controller.get_all_college_distances(your_location)
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return {'status': 'error', 'message': 'Valid latitude and longitude are required'}
+
+    # Rejects NaN and infinity too, which cannot be snapped to a grid cell
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return {'status': 'error', 'message': 'Valid latitude and longitude are required'}
+
+    cell = courses_controller.distances_cache.cell((latitude, longitude))
+
+    college_distances = await courses_controller.get_all_college_distances((latitude, longitude))
+
+    # Keep the user's token unless they moved to a different grid cell
+    token = data.get('sessionToken') or request.cookies.get(SESSION_COOKIE)
+    if sessions.token_cell(token) != cell:
+        token = sessions.new_token(cell)
+
+    sessions.set(token, {'cell': cell, 'college_distances': college_distances})
+    response.set_cookie(SESSION_COOKIE, token, max_age=sessions.ttl, httponly=True, samesite='lax')
 
     return {
         'status': 'success', 
         'latitude': latitude, 
-        'longitude': longitude
+        'longitude': longitude,
+        'sessionToken': token
     }
 
-@app.post("/search_by_title")
+@app.api_route("/search_by_title", methods=["GET", "POST"])
 async def search_by_title(request: Request):
     """
     Handles search requests for courses by title.
 
-    This function processes a POST request containing a JSON payload with a 'searchTerm' field.
+    This function processes a POST request containing a JSON payload with a 'searchTerm' field
+    (or a GET request with a 'searchTerm' query parameter).
     It validates the request, checks if a location is set, and then calls the courses_controller
     to search for courses by title. The results are then returned as a JSON response.
+    Responses are cached per search term and location and carry an ETag, so repeat
+    requests with a matching If-None-Match header get a 304.
 
     Returns:
         JSON response containing the search status, search term, and a list of course results.
@@ -74,85 +258,173 @@ async def search_by_title(request: Request):
         }
     
     try:
-        data = await request.json()
+        data = await read_search_params(request)
         search_term = data.get('searchTerm')
         
         # Input validation
         if not search_term:
             return {'status': 'error', 'message': 'Search term is required'}
 
-        # Gets the top courses, along with their course info(title, course_string, instructors, prerequisites, equivalencies)
-        # that most closely macthes the title the user search
-        # Pass college_distances (which may be None if location not set)
-        results = await courses_controller.search_by_title(search_term, college_distances)
+        session = await get_session(request, data)
+        college_distances = session['college_distances'] if session else None
+
+        # Searches differing only in case or surrounding spaces share one cached response; the
+        # term as typed is added to it per request
+        cache_key = ('title', search_term.strip().lower(), location_key(session))
+        data_version = courses_controller.data_version
+        entry = search_cache.get(cache_key, data_version)
+
+        if entry is None:
+            # Gets the top courses, along with their course info(title, course_string, instructors, prerequisites, equivalencies)
+            # that most closely macthes the title the user search
+            # Pass the session's college_distances (None if location not set)
+            results = await courses_controller.search_by_title(search_term, college_distances)
+
+            if not results:
+                # Not cached: an upstream embedding or vector search failure also yields no results
+                return {
+                    'status': 'success',
+                    'message': 'No results found',
+                    'results': []
+                }
 
-        if not results:
-            return {
+            entry = search_cache.set(cache_key, {
                 'status': 'success',
-                'message': 'No results found',
-                'results': []
-            }
-        
-        return {
-            'status': 'success',
-            'searchTerm': search_term,
-            'courses': results
-        }
+                'courses': results
+            }, data_version)
+
+        return cached_response(request, entry, {'searchTerm': search_term})
     
     except Exception as e:
+        courses_controller.metrics.count_error('search_by_title', e)
         return {
             'status': 'error',
             'message': f'An error occurred: {str(e)}'
         }
 
-@app.post("/search_by_code")
+@app.api_route("/search_by_code", methods=["GET", "POST"])
 async def search_by_code(request: Request):
     """
     Handles search requests for courses by last 3 digits of course code.
 
-    Expects a POST request with JSON payload containing last 3 digits of course code'.
+    Expects a POST request with JSON payload containing last 3 digits of course code'
+    (or a GET request with the same fields as query parameters).
     Uses the user's saved location to find nearby course equivalencies.
+    An optional 'term' (see /terms) searches another term or campus instead of the default data.
+    Responses are cached and carry an ETag like /search_by_title.
 
     Returns:
         JSON response with matching courses and their details
     """
     try:
 
-        data = await request.json()
+        data = await read_search_params(request)
         search_term = data.get('searchTerm', '')
+        prefix = str(data.get('prefix', False)).lower() in ('true', '1')
         
         if not search_term:
             return {'status': 'error', 'message': 'Course code is required'}
 
-        # returns all courses and their course info that ends with the 3 digits the user specifies
-        # Pass college_distances (which may be None if location not set)
-        results = await courses_controller.search_by_code(search_term, college_distances)
+        term = data.get('term')
+        catalog = await courses_controller.get_term_catalog(term)
+        if catalog is None:
+            return {'status': 'error', 'message': f'No course data for term {term}'}
 
-        if not results:
-            return {
-                'status': 'success',
-                'message': 'No results found',
-                'courses': []
-            }
-        
-        return {
-            'status': 'success',
-            'courseCode': search_term,
-            'courses': results
-        }
+        session = await get_session(request, data)
+        college_distances = session['college_distances'] if session else None
+
+        # The catalog's source changes whenever a term shard is refreshed
+        # Keyed on the code as sent, since the response echoes it
+        cache_key = ('code', search_term, prefix, location_key(session), term, catalog.source)
+        data_version = courses_controller.data_version
+        entry = search_cache.get(cache_key, data_version)
+
+        if entry is None:
+            # returns all courses and their course info that ends with the 3 digits the user specifies
+            # (or starts with the partial code when prefix matching)
+            # Pass the session's college_distances (None if location not set)
+            results = await courses_controller.search_by_code(search_term, college_distances, prefix, catalog)
+
+            if not results:
+                payload = {
+                    'status': 'success',
+                    'message': 'No results found',
+                    'courses': []
+                }
+            else:
+                payload = {
+                    'status': 'success',
+                    'courseCode': search_term,
+                    'courses': results
+                }
+            entry = search_cache.set(cache_key, payload, data_version)
+
+        return cached_response(request, entry)
     
     except Exception as e:
+        courses_controller.metrics.count_error('search_by_code', e)
         return {
             'status': 'error',
             'message': f'An error occurred: {str(e)}'
         }
 
+@app.get("/suggest_course_code")
+async def suggest_course_code(q: str = '', limit: int = 10, term: str = None):
+    """
+    Type-ahead suggestions for course codes.
+
+    Returns courses whose code starts with the partial code in the 'q' query parameter,
+    e.g. '198:1' or '01:198', optionally in another term (see /terms).
+    """
+    if not q.strip():
+        return {'status': 'success', 'suggestions': []}
+
+    catalog = await courses_controller.get_term_catalog(term)
+    if catalog is None:
+        return {'status': 'error', 'message': f'No course data for term {term}'}
+
+    return {
+        'status': 'success',
+        'query': q,
+        'suggestions': courses_controller.suggest_course_codes(q, max(1, min(limit, 50)), catalog)
+    }
+
+@app.get("/reverse_equivalency")
+async def reverse_equivalency(college: str = '', code: str = '', term: str = None):
+    """
+    Find what a community college course transfers as, e.g. ?college=Middlesex College&code=BIO 101.
+
+    Answered from a prebuilt (community college, course code) index joined to the Rutgers
+    course details, optionally from another term (see /terms).
+
+    Returns:
+        JSON response with the Rutgers courses the course transfers as
+    """
+    if not college.strip() or not code.strip():
+        return {'status': 'error', 'message': 'College and course code are required'}
+
+    catalog = await courses_controller.get_term_catalog(term)
+    if catalog is None:
+        return {'status': 'error', 'message': f'No course data for term {term}'}
+
+    results = courses_controller.reverse_equivalencies(college, code, catalog)
+    if results is None:
+        return {'status': 'error', 'message': f'Unknown community college: {college}'}
+
+    return {
+        'status': 'success',
+        'college': college,
+        'code': code,
+        'equivalencies': results
+    }
+
+
 @app.post("/search_by_professor")
 async def search_by_professor(request: Request):
     """
     Handles search requests for courses by professor's last name.
 
-    Expects a POST request with JSON payload containing 'searchTerm'.
+    Expects a POST request with JSON payload containing 'searchTerm', and optionally a 'term' (see /terms).
     Returns a list of professors and their courses, or suggestions.
     """
 
@@ -162,8 +434,13 @@ async def search_by_professor(request: Request):
         
         if not search_term:
             return {'status': 'error', 'message': 'Search term is required'}
-        
-        results = courses_controller.search_by_professor(search_term)
+
+        term = data.get('term')
+        catalog = await courses_controller.get_term_catalog(term)
+        if catalog is None:
+            return {'status': 'error', 'message': f'No course data for term {term}'}
+
+        results = await courses_controller.search_by_professor(search_term, catalog)
         
         return {
             'status': 'success',
@@ -171,11 +448,54 @@ async def search_by_professor(request: Request):
             'results': results
         }
     except Exception as e:
+        courses_controller.metrics.count_error('search_by_professor', e)
         return {
             'status': 'error',
             'message': f'An error occurred: {str(e)}'
         }
 
+def profile_startup(limit=15):
+    """
+    Report where worker startup time goes.
+
+    Imports the app in a fresh interpreter with -X importtime and prints the total startup time,
+    the time spent in app.py itself (controller construction and catalog load) and the slowest
+    top-level imports.
+
+    Args:
+        limit (int, optional): Number of imports to list. Defaults to 15.
+    """
+    import subprocess
+
+    code = "import time; start = time.perf_counter(); import app; print(f'{time.perf_counter() - start:.3f}')"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        return
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level; keep app and its direct imports
+        name = name[1:]
+        if len(name) - len(name.lstrip()) <= 2:
+            imports.append((int(cumulative_us), int(self_us), name.strip()))
+
+    print(f"Startup (import app): {float(result.stdout.strip().splitlines()[-1]) * 1000:.0f} ms")
+    for cumulative_us, self_us, name in imports:
+        if name == 'app':
+            print(f"app.py module body (controller and catalog): {self_us / 1000:.0f} ms")
+
+    print("\nSlowest imports:")
+    for cumulative_us, _, name in sorted(imports, reverse=True)[:limit]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
 if __name__ == '__main__':
+    if '--profile-startup' in sys.argv:
+        profile_startup()
+        sys.exit(0)
+
     port = int(os.environ.get("PORT", 5005))
     uvicorn.run(app, host="0.0.0.0", port=port)  
\ No newline at end of file
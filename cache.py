@@ -0,0 +1,475 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class sqlite_store:
+    """
+    Key/value table in a SQLite database that several worker processes can share.
+
+    Attributes:
+        path (str): SQLite database path
+        table (str): Table holding the entries
+        ttl (float): Seconds an entry stays valid, or None to never expire
+    """
+
+    def __init__(self, path, table, ttl=None):
+        """
+        Open (and create if needed) the database table.
+
+        Args:
+            path (str): SQLite database path.
+            table (str): Table holding the entries.
+            ttl (float, optional): Seconds an entry stays valid. Defaults to None (no expiry).
+        """
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        self._db = None
+        self.pid = None
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        db = sqlite3.connect(path, timeout=5)
+        # WAL lets several worker processes read while one writes
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL)'
+        )
+        if ttl is not None:
+            db.execute(f'DELETE FROM {table} WHERE created < ?', (time.time() - ttl,))
+        db.commit()
+        db.close()
+
+    @property
+    def db(self):
+        """The SQLite connection for the current process, opened on first use.
+
+        SQLite connections must not be used across fork, so gunicorn workers forked from a
+        preloaded master each open their own.
+        """
+        if self._db is None or self.pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self.pid = os.getpid()
+        return self._db
+
+    def get(self, key):
+        """
+        Read an entry.
+
+        Args:
+            key (str): The entry key.
+
+        Returns:
+            tuple: (value bytes, created timestamp), or None if missing, expired or unreadable.
+        """
+        try:
+            with self.lock:
+                row = self.db.execute(f'SELECT value, created FROM {self.table} WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading {self.table} cache: {e}")
+            return None
+
+        if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            return None
+        return row
+
+    def set(self, key, value, created=None):
+        """
+        Write an entry, replacing any existing one.
+
+        Args:
+            key (str): The entry key.
+            value (bytes): The entry value.
+            created (float, optional): Creation timestamp. Defaults to now.
+        """
+        try:
+            with self.lock:
+                self.db.execute(
+                    f'INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)',
+                    (key, value, created if created is not None else time.time())
+                )
+                self.db.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing {self.table} cache: {e}")
+
+
+class embedding_cache:
+    """
+    Cache of query embeddings keyed on the normalized query text.
+
+    Entries live in a size-bounded in-memory LRU. When a path is given, entries are also
+    written to a SQLite database so they survive restarts and are shared between gunicorn
+    workers; a miss in memory falls back to the database before calling the embedding API.
+
+    Attributes:
+        max_size (int): Maximum number of entries kept in memory
+        ttl (float): Seconds an entry stays valid, or None to never expire
+        store (sqlite_store): Persistent store, or None for a memory-only cache
+        hits (int): Lookups answered from memory or disk
+        misses (int): Lookups that needed a new embedding
+        disk_hits (int): Hits answered from the SQLite store
+    """
+
+    def __init__(self, max_size=1024, ttl=None, path=None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size (int, optional): Maximum number of entries kept in memory. Defaults to 1024.
+            ttl (float, optional): Seconds an entry stays valid. Defaults to None (no expiry).
+            path (str, optional): SQLite database path for the persistent store. Defaults to None.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self.store = sqlite_store(path, 'embeddings', ttl) if path else None
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalize a query so trivially different spellings share an entry.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            str: Lowercased text with surrounding whitespace removed and inner whitespace collapsed.
+        """
+        return re.sub(r'\s+', ' ', (text or '').strip().lower())
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, text):
+        """
+        Look up the embedding for a query.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            numpy.ndarray: The cached embedding, or None on a miss.
+        """
+        key = self.normalize(text)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                created, vector = entry
+                if not self._expired(created):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self.entries[key]
+
+            if self.store is not None:
+                row = self.store.get(key)
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, row[1], vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def set(self, text, vector):
+        """
+        Store the embedding for a query.
+
+        Args:
+            text (str): The query text.
+            vector (array-like): The embedding.
+        """
+        key = self.normalize(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        created = time.time()
+
+        with self.lock:
+            self._remember(key, created, vector)
+
+            if self.store is not None:
+                self.store.set(key, vector.tobytes(), created)
+
+    def _remember(self, key, created, vector):
+        # Caller holds the lock
+        self.entries[key] = (created, vector)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Report cache size and hit/miss counters.
+
+        Returns:
+            dict: Entry count, hits, misses, disk hits and hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class distance_cache:
+    """
+    Cache of college distance tables keyed on a grid cell around the user's location.
+
+    Locations are snapped to a square grid (0.01 degrees is about 1 km), so users a few meters
+    apart share an entry and distances are computed from the cell center. Entries live in a
+    size-bounded in-memory LRU and, when a path is given, in a SQLite database shared by all
+    gunicorn workers. Stored tables are keyed on how they were computed (the distance mode and
+    detour factor), so changing either never serves tables computed the old way, and they
+    expire after ttl seconds.
+
+    Attributes:
+        cell_size (float): Grid cell size in degrees
+        max_size (int): Maximum number of entries kept in memory
+        ttl (float): Seconds an entry stays valid, or None to never expire
+        variant (str): How the distances are computed, part of every stored key
+        hits (int): Lookups answered from memory or disk
+        misses (int): Lookups that needed new distances
+        disk_hits (int): Hits answered from the SQLite store
+    """
+
+    def __init__(self, cell_size=0.01, max_size=4096, path=None, ttl=None, variant=''):
+        """
+        Initialize the cache.
+
+        Args:
+            cell_size (float, optional): Grid cell size in degrees. Defaults to 0.01.
+            max_size (int, optional): Maximum number of entries kept in memory. Defaults to 4096.
+            path (str, optional): SQLite database path for the shared store. Defaults to None.
+            ttl (float, optional): Seconds an entry stays valid. Defaults to None (no expiry).
+            variant (str, optional): How the distances are computed, e.g. 'local:1.3'. Defaults to ''.
+        """
+        self.cell_size = cell_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.variant = variant
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.store = sqlite_store(path, 'distances', ttl) if path else None
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def cell(self, location):
+        """
+        Snap a location to its grid cell.
+
+        Args:
+            location (tuple): (latitude, longitude) in degrees.
+
+        Returns:
+            tuple: Integer (row, column) of the grid cell.
+        """
+        return (math.floor(float(location[0]) / self.cell_size), math.floor(float(location[1]) / self.cell_size))
+
+    def cell_center(self, cell):
+        """
+        Get the center of a grid cell.
+
+        Args:
+            cell (tuple): Integer (row, column) of the grid cell.
+
+        Returns:
+            tuple: (latitude, longitude) of the cell center in degrees.
+        """
+        return ((cell[0] + 0.5) * self.cell_size, (cell[1] + 0.5) * self.cell_size)
+
+    def _store_key(self, cell):
+        # 'ranked:' marks tables stored nearest college first; older unordered entries are never read
+        return f"ranked:{self.variant}:{self.cell_size}:{cell[0]}:{cell[1]}"
+
+    def get(self, cell):
+        """
+        Look up the distance table for a grid cell.
+
+        Args:
+            cell (tuple): Integer (row, column) of the grid cell.
+
+        Returns:
+            dict: College names mapped to distances in miles, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(cell)
+            if entry is not None:
+                created, distances = entry
+                if self.ttl is None or time.time() - created <= self.ttl:
+                    self.entries.move_to_end(cell)
+                    self.hits += 1
+                    return distances
+                del self.entries[cell]
+
+            if self.store is not None:
+                row = self.store.get(self._store_key(cell))
+                if row is not None:
+                    distances = json.loads(row[0])
+                    self._remember(cell, row[1], distances)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return distances
+
+            self.misses += 1
+            return None
+
+    def set(self, cell, distances):
+        """
+        Store the distance table for a grid cell.
+
+        Args:
+            cell (tuple): Integer (row, column) of the grid cell.
+            distances (dict): College names mapped to distances in miles.
+        """
+        created = time.time()
+        with self.lock:
+            self._remember(cell, created, distances)
+
+        if self.store is not None:
+            self.store.set(self._store_key(cell), json.dumps(distances).encode('utf-8'), created)
+
+    def _remember(self, cell, created, distances):
+        # Caller holds the lock
+        self.entries[cell] = (created, distances)
+        self.entries.move_to_end(cell)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Report cache size and hit/miss counters.
+
+        Returns:
+            dict: Entry count, hits, misses, disk hits and hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class response_cache:
+    """
+    LRU cache of serialized search responses with ETags.
+
+    Entries are stored with the version of the loaded data they were computed from, so
+    a response computed before a data reload is never served after it. Entries for older
+    versions are dropped as soon as a newer version is seen.
+
+    Attributes:
+        max_size (int): Maximum number of cached responses
+        version (int): Newest data version seen
+        hits (int): Lookups answered from the cache
+        misses (int): Lookups that had to be computed
+    """
+
+    def __init__(self, max_size=512):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size (int, optional): Maximum number of cached responses. Defaults to 512.
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version):
+        # Caller holds the lock
+        if self.version is None or version > self.version:
+            self.version = version
+            self.entries.clear()
+
+    def get(self, key, version=0):
+        """
+        Look up a cached response.
+
+        Args:
+            key (tuple): The cache key.
+            version (int, optional): Version of the loaded data. Defaults to 0.
+
+        Returns:
+            tuple: (body bytes, etag) or None on a miss.
+        """
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get((version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end((version, key))
+            self.hits += 1
+            return entry
+
+    def set(self, key, payload, version=0):
+        """
+        Serialize and cache a response payload.
+
+        Args:
+            key (tuple): The cache key.
+            payload (dict): JSON-serializable response payload.
+            version (int, optional): Version of the loaded data the payload was computed from. Defaults to 0.
+
+        Returns:
+            tuple: (body bytes, etag) for the payload.
+        """
+        body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+        entry = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+
+        with self.lock:
+            self._check_version(version)
+            # A payload computed from data that has since been reloaded is returned but not cached
+            if version == self.version:
+                self.entries[(version, key)] = entry
+                self.entries.move_to_end((version, key))
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+        return entry
+
+    def stats(self):
+        """
+        Report cache size and hit/miss counters.
+
+        Returns:
+            dict: Entry count, hits, misses and hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+        }
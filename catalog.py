@@ -0,0 +1,443 @@
+import gc
+import json
+import os
+import pickle
+import re
+import subprocess
+import sys
+
+from name_index import ngram_index
+
+# Bump when the catalog's structure changes so old snapshots are rebuilt from JSON
+SNAPSHOT_VERSION = 3
+
+# Shard names made by term_key(), e.g. '2025-9-NB'
+TERM_KEY_PATTERN = re.compile(r'\d{4}-\d-[A-Z]{2}')
+
+
+def remove_em_tags(text):
+    """Remove <em> and </em> tags from text.
+    
+    Args:
+        text (str): The text to be cleaned.
+        
+    Returns:
+        str: The text with HTML em tags removed.
+    """
+    if not text:
+        return text
+    return re.sub(r'</?em>', '', text)
+
+
+def format_instructor_name(name) -> str:
+    """Formats instructor names into a more readable 'Firstname Lastname' format.
+    
+    Handles 'LASTNAME, FIRSTNAME' and 'LASTNAME' formats, and returns 'TBA' for unknown instructors.
+
+    Args:
+        name (str): The instructor's name as a string.
+
+    Returns:
+        str: The formatted name.
+    """
+    if not name or name == 'UNKNOWN':
+        return 'TBA'
+    
+    # Handle "LASTNAME, FIRSTNAME" format
+    if ',' in name:
+        parts = []
+        for p in name.split(','):
+            parts.append(p.strip())
+
+        if len(parts) == 2:
+            # Title-case both parts and join as "Firstname Lastname"
+            return f"{parts[1].title()} {parts[0].title()}"
+    
+    # Handle "LASTNAME" format (or any other format) by just title-casing it
+    return name.title()
+
+
+def term_key(year, term, campus):
+    """Name of the course data shard for one term and campus, e.g. '2025-9-NB'.
+
+    Args:
+        year (int): Year of the term.
+        term (int): Term number (1 Spring, 7 Summer, 9 Fall).
+        campus (str): Campus code (NB, NK or CM).
+
+    Returns:
+        str: The shard name, also used as the term parameter of the search endpoints.
+    """
+    return f"{year}-{term}-{campus}"
+
+
+# Instructor group shown for sections that have no instructor yet
+TBA_INSTRUCTORS = ({'name': 'TBA'},)
+
+
+class course_record:
+    """
+    Immutable, compact view of a course holding only the fields search uses.
+
+    The catalog keeps these records instead of the raw course data, so section details the app
+    never reads (meeting times, comments, campus locations, ...) are dropped after loading.
+    Everything in a search result that does not depend on the user's location is computed
+    once here, so a request only has to add the equivalencies.
+
+    Attributes:
+        title (str): Course title
+        course_number (str): Course string, e.g. '01:198:111'
+        course_code (str): Course string with colons removed, e.g. '01198111'
+        instructors (tuple): One tuple of {'name': ...} dicts per distinct section instructor group
+        section_instructors (tuple): Distinct tuples of raw instructor names per section, () for sections without any
+        prerequisites (str): Prerequisite notes with em tags removed
+        synopsis_url (str): Link to the course synopsis
+    """
+
+    __slots__ = ('title', 'course_number', 'course_code', 'instructors', 'section_instructors',
+                 'prerequisites', 'synopsis_url')
+
+    def __init__(self, title, course_number, instructors, section_instructors, prerequisites, synopsis_url):
+        for name, value in (
+            ('title', title),
+            ('course_number', course_number),
+            ('course_code', course_number.replace(':', '').strip()),
+            ('instructors', instructors),
+            ('section_instructors', section_instructors),
+            ('prerequisites', prerequisites),
+            ('synopsis_url', synopsis_url),
+        ):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"course_record is immutable, cannot set '{name}'")
+
+    def __reduce__(self):
+        # Rebuild through __init__ when unpickling, since __setattr__ is disabled
+        return (course_record, (self.title, self.course_number, self.instructors, self.section_instructors,
+                                self.prerequisites, self.synopsis_url))
+
+    @classmethod
+    def from_course(cls, course, format_name, clean_text, entries=None):
+        """
+        Build a record from a raw course object.
+
+        Args:
+            course (dict): A course object from the course data file.
+            format_name (callable): Formats a raw instructor name for display.
+            clean_text (callable): Removes markup from prerequisite notes.
+            entries (dict, optional): {'name': ...} instructor entries by raw name, shared between
+                records so each instructor is stored once. Defaults to None (not shared).
+
+        Returns:
+            course_record: The precomputed record.
+        """
+        if entries is None:
+            entries = {}
+
+        instructors_for_course = []
+        section_instructors = []
+        seen_groups = set()
+
+        # Loops through each section to extract the instructors
+        for section in course.get('sections', []):
+            names = tuple(sys.intern(i.get('name') or '') for i in section.get('instructors', []))
+            if names not in section_instructors:
+                section_instructors.append(names)
+
+            if not names:
+                instructors_for_course.append(TBA_INSTRUCTORS)
+                continue
+
+            for name in names:
+                if name not in entries:
+                    entries[name] = {'name': sys.intern(format_name(name))}
+
+            formatted = tuple(entries[name]['name'] for name in names)
+            if formatted not in seen_groups:
+                seen_groups.add(formatted)
+                instructors_for_course.append(tuple(entries[name] for name in names))
+
+        return cls(
+            title=course.get('title'),
+            course_number=course.get('courseString') or '',
+            instructors=tuple(instructors_for_course),
+            section_instructors=tuple(section_instructors),
+            prerequisites=sys.intern(clean_text(course.get('preReqNotes') or "No prerequisites")),
+            synopsis_url=course.get('synopsisUrl', '')
+        )
+
+    def to_dict(self, equivalencies):
+        """
+        Combine the record with location-dependent equivalencies into a search result.
+
+        Args:
+            equivalencies (list): Course equivalencies for the user's location.
+
+        Returns:
+            dict: Course data with the course number, title, prerequisites, instructors and equivalencies.
+        """
+        return {
+            'title': self.title,
+            'course_number': self.course_number,
+            'instructors': self.instructors,
+            'prerequisites': self.prerequisites,
+            'equivalencies': equivalencies,
+            'synopsisUrl': self.synopsis_url,
+        }
+
+
+class course_catalog:
+    """
+    Rutgers course records and the lookup maps built from them.
+
+    Only compact course_record objects are kept; the raw course data is dropped once the
+    maps are built. Building walks the whole catalog, so a built catalog can be written to a
+    pickle snapshot and loaded directly by later processes while the source JSON is unchanged.
+
+    Attributes:
+        courses (list): Course records, in catalog order
+        courses_by_title (dict): Mapping of lowercased course titles to course records
+        courses_by_code (dict): Mapping of course codes (colons removed) to course records
+        courses_by_code_title (dict): Mapping of course codes to lowercased titles
+        code_suffix_index (dict): Mapping of every suffix of a colon-free course code to matching course codes
+        code_prefix_index (dict): Mapping of every prefix of a course code form to matching course codes
+        instructors_courses (dict): Mapping of instructors to their courses
+        professor_index (ngram_index): N-gram index over instructor names for substring and fuzzy search
+        source (tuple): (mtime_ns, size) of the JSON file the catalog was built from
+    """
+
+    def __init__(self, courses_data, source=None):
+        """
+        Build the catalog from raw course data. The raw data is not kept.
+
+        Args:
+            courses_data (list): Course objects from the course data file.
+            source (tuple, optional): (mtime_ns, size) of the source file.
+        """
+        self.source = source
+        self.build_course_mappings(courses_data)
+
+    @staticmethod
+    def file_signature(path):
+        """
+        Identify the current version of a file.
+
+        Args:
+            path (str): Path to the file.
+
+        Returns:
+            tuple: (mtime_ns, size), or None if the file does not exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def from_json(cls, courses_data_path):
+        """
+        Build the catalog from the course data JSON file.
+
+        Args:
+            courses_data_path (str): Path to courses JSON file.
+
+        Returns:
+            course_catalog: The built catalog.
+        """
+        source = cls.file_signature(courses_data_path)
+        with open(courses_data_path, 'r') as json_file:
+            courses_data = json.load(json_file)
+        return cls(courses_data, source)
+
+    @classmethod
+    def load(cls, courses_data_path, snapshot_path=None):
+        """
+        Load the catalog, from the snapshot when it was built from the current JSON file.
+
+        Args:
+            courses_data_path (str): Path to courses JSON file.
+            snapshot_path (str, optional): Path to the catalog snapshot. Defaults to None (no snapshot).
+
+        Returns:
+            course_catalog: The loaded catalog.
+        """
+        if snapshot_path:
+            source = cls.file_signature(courses_data_path)
+            catalog = cls.load_snapshot(snapshot_path, source)
+            if catalog is None and cls.build_snapshot(courses_data_path, snapshot_path):
+                catalog = cls.load_snapshot(snapshot_path, source)
+            if catalog is not None:
+                return catalog
+        return cls.from_json(courses_data_path)
+
+    @classmethod
+    def build_snapshot(cls, courses_data_path, snapshot_path):
+        """
+        Build the catalog from the JSON file in a child process and write it to a snapshot.
+
+        Parsing the raw JSON takes several times the memory of the finished catalog, most
+        of it stays resident after the raw data is freed, and the parser holds the GIL
+        throughout. Parsing in a short-lived child process keeps both out of the caller,
+        which then loads the compact snapshot.
+
+        Args:
+            courses_data_path (str): Path to courses JSON file.
+            snapshot_path (str): Path to write the catalog snapshot to.
+
+        Returns:
+            bool: True if the snapshot was written.
+        """
+        result = subprocess.run([
+            sys.executable, os.path.abspath(__file__),
+            os.path.abspath(courses_data_path), os.path.abspath(snapshot_path)
+        ])
+        return result.returncode == 0
+
+    @classmethod
+    def load_snapshot(cls, snapshot_path, source=None):
+        """
+        Load a catalog snapshot.
+
+        Args:
+            snapshot_path (str): Path to the catalog snapshot.
+            source (tuple, optional): Expected source file signature; the snapshot is ignored if it differs.
+
+        Returns:
+            course_catalog: The loaded catalog, or None if the snapshot is missing, stale or unreadable.
+        """
+        if not os.path.exists(snapshot_path):
+            return None
+
+        # Unpickling creates millions of objects; pausing the cyclic collector avoids repeated full scans
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(snapshot_path, 'rb') as snapshot_file:
+                # A small header comes first, so a stale snapshot is rejected without loading the catalog
+                header = pickle.load(snapshot_file)
+                if not isinstance(header, dict) or header.get('version') != SNAPSHOT_VERSION:
+                    return None
+                if source is not None and header.get('source') != source:
+                    return None
+                return pickle.load(snapshot_file)
+        except Exception as e:
+            print(f"Error loading catalog snapshot {snapshot_path}: {e}")
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def save_snapshot(self, snapshot_path):
+        """
+        Write the catalog to a snapshot file atomically.
+
+        Args:
+            snapshot_path (str): Path to the catalog snapshot.
+        """
+        os.makedirs(os.path.dirname(snapshot_path) or '.', exist_ok=True)
+        temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as snapshot_file:
+            pickle.dump({'version': SNAPSHOT_VERSION, 'source': self.source}, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, snapshot_path)
+
+    # build course mappings
+    def build_course_mappings(self, courses_data):
+        """
+        Build course records and the mappings for courses, titles, and instructors.
+
+        Creates efficient lookup dictionaries for:
+        - Courses by title
+        - Courses by code
+        - Course code suffixes and prefixes
+        - Instructors and their courses
+        - An n-gram index over instructor names
+
+        Args:
+            courses_data (list): Course objects from the course data file.
+        """
+        self.courses = []
+        self.courses_by_title = {}
+        self.courses_by_code = {}
+        self.courses_by_code_title = {}
+        self.code_suffix_index = {}
+        self.code_prefix_index = {}
+        self.instructors_courses = {}
+        instructor_entries = {}
+
+        for course in courses_data:
+            record = course_record.from_course(course, format_instructor_name, remove_em_tags, instructor_entries)
+            self.courses.append(record)
+
+            title = (record.title or '').lower()
+            course_string = record.course_number
+            # Map by title
+            self.courses_by_title[title] = record
+            
+            # Map by full course code (removing colon and any whitespace)
+            full_code = record.course_code
+            if full_code not in self.courses_by_code:
+                self._index_course_code(full_code, course_string)
+            self.courses_by_code[full_code] = record
+            
+            # Map course code to title
+            self.courses_by_code_title[full_code] = title
+
+            # Store both title and course string, once per course
+            course_info = {'title': title, 'courseString': course_string}
+
+            # Handle multiple instructors per section
+            for names in record.section_instructors:
+                for instructor_name in names:
+                    if instructor_name not in self.instructors_courses:
+                        self.instructors_courses[instructor_name] = []
+
+                    if course_info not in self.instructors_courses[instructor_name]:
+                        self.instructors_courses[instructor_name].append(course_info)
+
+        self.professor_index = ngram_index(self.instructors_courses.keys())
+
+    # index course code suffixes and prefixes
+    def _index_course_code(self, full_code, course_string):
+        """
+        Add a course code to the suffix and prefix indexes.
+
+        Suffixes are taken from the colon-free code ("01198111" -> "111", "198111", ...), which is what
+        search by code matches against. Prefixes are taken from the full ("01:198:111") and
+        subject:number ("198:111") forms, with and without colons, for partial and type-ahead matching.
+
+        Args:
+            full_code (str): Course code with colons removed, e.g. '01198111'.
+            course_string (str): Course code as listed in the catalog, e.g. '01:198:111'.
+        """
+        for i in range(len(full_code)):
+            self.code_suffix_index.setdefault(full_code[i:], []).append(full_code)
+
+        forms = {course_string.strip()}
+        parts = course_string.strip().split(':')
+        if len(parts) == 3:
+            forms.add(f"{parts[1]}:{parts[2]}")
+        forms |= {form.replace(':', '') for form in forms}
+
+        prefixes = set()
+        for form in forms:
+            for i in range(1, len(form) + 1):
+                prefixes.add(form[:i])
+
+        for prefix in prefixes:
+            self.code_prefix_index.setdefault(prefix, []).append(full_code)
+
+
+
+if __name__ == "__main__":
+    # Child process of course_catalog.build_snapshot: catalog.py <courses json> <snapshot>.
+    # Import the module by name so pickled classes are catalog.*, not __main__.*
+    from catalog import course_catalog as catalog_class
+
+    try:
+        catalog_class.from_json(sys.argv[1]).save_snapshot(sys.argv[2])
+    except Exception as e:
+        print(f"Error building catalog snapshot {sys.argv[2]}: {e}")
+        sys.exit(1)
@@ -1,16 +1,21 @@
-import json
 import os
+import json
 import numpy as np
 import asyncio
-import aiohttp
-import pandas as pd
-import re
-from pinecone import Pinecone, ServerlessSpec
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import google.generativeai as genai
 from typing import List, Dict
-import difflib
+from vector_store import local_vector_index
+from cache import distance_cache, embedding_cache
+from metrics import metrics_registry
+from equivalency_store import equivalency_table, normalize_course_code
+from catalog import TERM_KEY_PATTERN, course_catalog, course_record, format_instructor_name, remove_em_tags, term_key
+from distances import DEFAULT_DETOUR_FACTOR, estimate_driving_miles, mapbox_matrix_client, rank_by_distance
 import math
+import time
 
 class course_search:
     """
@@ -20,19 +25,46 @@ class course_search:
     including vector search, course equivalencies, and distance calculations.
 
     Attributes:
-        courses_data (list): Loaded course data from JSON file
-        courses_by_title (dict): Mapping of course titles to course details
-        courses_by_code (dict): Mapping of course codes to course details
+        catalog (course_catalog): Course records and lookup maps; the attributes below read from it
+        courses (list): Compact course records, in catalog order
+        courses_by_title (dict): Mapping of course titles to course records
+        courses_by_code (dict): Mapping of course codes to course records
+        code_suffix_index (dict): Mapping of every suffix of a colon-free course code to matching course codes
+        code_prefix_index (dict): Mapping of every prefix of a course code form to matching course codes
         instructors_courses (dict): Mapping of instructors to their courses
+        professor_index (ngram_index): N-gram index over instructor names for substring and fuzzy search
+        equivalencies (equivalency_table): Columnar equivalency table sorted by Rutgers course code
+        default_term (str): Shard name of the default course data, e.g. '2025-9-NB', if known
+        term_catalogs (OrderedDict): Catalogs of other terms loaded from their shards, least recently used first
     """
 
-    def __init__(self, courses_data_path = 'data/rutgers_courses.json'):
+    courses = property(lambda self: self.catalog.courses)
+    courses_by_title = property(lambda self: self.catalog.courses_by_title)
+    courses_by_code = property(lambda self: self.catalog.courses_by_code)
+    courses_by_code_title = property(lambda self: self.catalog.courses_by_code_title)
+    code_suffix_index = property(lambda self: self.catalog.code_suffix_index)
+    code_prefix_index = property(lambda self: self.catalog.code_prefix_index)
+    instructors_courses = property(lambda self: self.catalog.instructors_courses)
+    professor_index = property(lambda self: self.catalog.professor_index)
+
+    def __init__(self, courses_data_path = 'data/rutgers_courses.json', equivalencies_path = 'data/community_to_college.csv',
+                 vector_backend = None, vector_index_path = None, catalog_snapshot_path = None):
         """
         Initialize the course_search controller with course data.
 
         Args:
             courses_data_path (str, optional): Path to courses JSON file. 
                 Defaults to 'data/rutgers_courses.json'.
+            equivalencies_path (str, optional): Path to the community college equivalency CSV file.
+                Defaults to 'data/community_to_college.csv'. Its typed, columnar form is cached
+                next to it as a .npz store.
+            vector_backend (str, optional): 'pinecone' to query the hosted index or 'local' to search an
+                in-process index. Defaults to the VECTOR_BACKEND environment variable, then 'pinecone'.
+            vector_index_path (str, optional): Base path of the local vector index files. Defaults to the
+                LOCAL_VECTOR_INDEX_PATH environment variable, then 'data/course_vectors'.
+            catalog_snapshot_path (str, optional): Path to a prebuilt catalog snapshot, used instead of the
+                JSON file when it was built from the current JSON. Defaults to the CATALOG_SNAPSHOT_PATH
+                environment variable, then 'data/rutgers_courses.snapshot.pkl'. An empty string disables it.
         """
 
         load_dotenv()
@@ -41,18 +73,91 @@ class course_search:
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         self.mapbox_access_token = os.getenv("MAPBOX_ACCESS_TOKEN")
 
-        # Initialize Google Gemini client for embeddings
-        genai.configure(api_key=self.google_api_key)
+        # Gemini and Pinecone are imported and their clients built on first use, so workers
+        # that only serve code or professor searches never pay for them
+        self._genai = None
+        self._index = None
+        self.client_lock = threading.Lock()
+
+        # Blocking upstream calls (Gemini, Pinecone) run on a bounded thread pool so they
+        # never stall the event loop, each stage with its own timeout in seconds
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("SEARCH_EXECUTOR_WORKERS", 8)),
+            thread_name_prefix="course-search"
+        )
+        self.embed_timeout = float(os.getenv("EMBED_TIMEOUT", 5))
+        self.vector_query_timeout = float(os.getenv("VECTOR_QUERY_TIMEOUT", 5))
         
-        # Initialize Pinecone client
-        self.pc = Pinecone(api_key=self.pinecone_api_key)
-        self.index = self.pc.Index("courses-gemini")  # Changed to use Gemini embeddings index
-        self.distances_cache = {}
-
-        # Load courses data
-        with open(courses_data_path, 'r') as json_file:
-            self.courses_data = json.load(json_file)
-
+        self.vector_backend = vector_backend or os.getenv("VECTOR_BACKEND", "pinecone")
+        self.vector_index_path = vector_index_path or os.getenv("LOCAL_VECTOR_INDEX_PATH", "data/course_vectors")
+
+        if self.vector_backend not in ("local", "pinecone"):
+            raise ValueError(f"Unknown vector backend: {self.vector_backend}")
+
+        # 'local' estimates driving distances offline, 'mapbox' asks the Directions API,
+        # 'refine' answers with the local estimate and then refines it with Mapbox in the background
+        self.distance_mode = os.getenv("DISTANCE_MODE", "local")
+        self.detour_factor = float(os.getenv("DETOUR_FACTOR", DEFAULT_DETOUR_FACTOR))
+        self.refine_tasks = set()
+
+        # Distance tables per ~1 km grid cell; DISTANCE_CACHE_PATH shares them between workers in SQLite.
+        # Stored tables are keyed on the mode and detour factor and expire after DISTANCE_CACHE_TTL seconds
+        self.distances_cache = distance_cache(
+            cell_size=float(os.getenv("DISTANCE_CACHE_CELL", 0.01)),
+            max_size=int(os.getenv("DISTANCE_CACHE_SIZE", 4096)),
+            path=os.getenv("DISTANCE_CACHE_PATH"),
+            ttl=float(os.getenv("DISTANCE_CACHE_TTL", 7 * 86400)),
+            variant=f"{self.distance_mode}:{self.detour_factor}"
+        )
+
+        # One pooled HTTP session for all Mapbox requests
+        self.mapbox_client = mapbox_matrix_client(
+            self.mapbox_access_token,
+            timeout=float(os.getenv("MAPBOX_TIMEOUT", 10)),
+            max_retries=int(os.getenv("MAPBOX_MAX_RETRIES", 2)),
+            max_concurrency=int(os.getenv("MAPBOX_MAX_CONCURRENCY", 4))
+        )
+
+        # Cache query embeddings; EMBEDDING_CACHE_PATH persists them in SQLite shared by all workers
+        embedding_cache_ttl = os.getenv("EMBEDDING_CACHE_TTL")
+        self.embedding_cache = embedding_cache(
+            max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", 1024)),
+            ttl=float(embedding_cache_ttl) if embedding_cache_ttl else None,
+            path=os.getenv("EMBEDDING_CACHE_PATH")
+        )
+
+        # Per-stage latency histograms and error counts, exported by the /metrics endpoint
+        self.metrics = metrics_registry()
+        self.join_histogram = self.metrics.stage_histogram('equivalency_join')
+
+        # Each equivalency table has its own row cache; the hits and misses of the tables
+        # replaced by reloads are kept here so the exported counters never go backwards
+        self.retired_row_hits = 0
+        self.retired_row_misses = 0
+
+        self.courses_data_path = courses_data_path
+        self.equivalencies_path = equivalencies_path
+        if catalog_snapshot_path is None:
+            catalog_snapshot_path = os.getenv("CATALOG_SNAPSHOT_PATH", os.path.splitext(courses_data_path)[0] + '.snapshot.pkl')
+        self.catalog_snapshot_path = catalog_snapshot_path
+
+        # Data files are re-read by reload_data(); data_version counts the reloads swapped in
+        self.data_signature = self.data_files_signature()
+        self.data_version = 0
+        self.reload_lock = asyncio.Lock()
+        self.reload_interval = float(os.getenv("DATA_RELOAD_INTERVAL", 30))
+        self.watch_task = None
+
+        # Load courses data and lookup maps, from the snapshot when it is current
+        self.catalog = course_catalog.load(courses_data_path, catalog_snapshot_path)
+        self.default_term = self.read_default_term()
+
+        # Other terms and campuses are loaded from their shards on first request, keeping
+        # at most TERM_CACHE_SIZE of them in memory at once
+        self.term_data_dir = os.getenv("TERM_DATA_DIR", "data/terms")
+        self.term_cache_size = int(os.getenv("TERM_CACHE_SIZE", 2))
+        self.term_catalogs = OrderedDict()
+        self.term_lock = asyncio.Lock()
       
         self.community_colleges = {
              "Rowan College of South Jersey - Cumberland Campus": (39.4794, -75.0289),
@@ -75,14 +180,59 @@ class course_search:
              "UCNJ Union College of Union County, NJ": (40.6494, -74.3089),
              "Warren County Community College": (40.7594, -75.0089)
          }
+        self.college_names = list(self.community_colleges.keys())
+        self.college_coordinates = np.array(list(self.community_colleges.values()), dtype=np.float64)
+
+        self.build_equivalency_mappings(equivalencies_path)
+
+    @property
+    def genai(self):
+        """The google.generativeai module, imported and configured on first use."""
+        if self._genai is None:
+            with self.client_lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.google_api_key)
+                    self._genai = genai
+        return self._genai
+
+    @property
+    def index(self):
+        """The vector index (Pinecone or local), built on first use."""
+        return self.load_index()
+
+    def load_index(self):
+        """
+        Build the vector index now if it has not been built yet.
 
-         # Initialize course mappings
-        self.courses_by_title = {}
-        self.courses_by_code = {}
-        self.courses_by_code_title = {}
-        self.instructors_courses = {}
+        Returns:
+            The local vector index or the Pinecone index.
+        """
+        if self._index is None:
+            with self.client_lock:
+                if self._index is None:
+                    if self.vector_backend == "local":
+                        # Search a memory-mapped embedding matrix in-process instead of calling Pinecone
+                        self._index = local_vector_index.load(self.vector_index_path)
+                    else:
+                        # Initialize Pinecone client
+                        from pinecone import Pinecone
+                        self.pc = Pinecone(api_key=self.pinecone_api_key)
+                        self._index = self.pc.Index("courses-gemini")  # Changed to use Gemini embeddings index
+        return self._index
+
+    # load shared read-only data before gunicorn forks its workers
+    def preload(self):
+        """
+        Load read-only data that forked workers should share copy-on-write.
 
-        self.build_course_mappings()
+        The catalog and equivalencies are already loaded by __init__; this also builds the reverse
+        equivalency index and loads the local vector index. Gemini and Pinecone clients are left
+        for each worker to build, since their connections cannot be shared across a fork.
+        """
+        self.equivalencies.build_reverse_index()
+        if self.vector_backend == "local":
+            self.load_index()
 
     # remove em tags from text
     def remove_em_tags(self, text):
@@ -94,54 +244,206 @@ class course_search:
         Returns:
             str: The text with HTML em tags removed.
         """
-        if not text:
-            return text
-        return re.sub(r'</?em>', '', text)
+        return remove_em_tags(text)
 
     # build course mappings
     def build_course_mappings(self):
         """
-        Build internal mappings for courses, titles, and instructors.
+        Rebuild the catalog's records and lookup maps from the course data file.
+        """
+        self.catalog = course_catalog.from_json(self.courses_data_path)
 
-        Creates efficient lookup dictionaries for:
-        - Courses by title
-        - Courses by code
-        - Instructors and their courses
+    # build equivalency mappings
+    def build_equivalency_mappings(self, equivalencies_path):
         """
-        for course in self.courses_data:
-            title = course.get('title', '').lower()
-            course_string = course.get('courseString', '')
-            # Map by title
-            self.courses_by_title[title] = course
-            
-            # Map by full course code (removing colon and any whitespace)
-            full_code = course_string.replace(':', '').strip()
-            self.courses_by_code[full_code] = course
-            
-            # Map course code to title
-            self.courses_by_code_title[full_code] = title
+        Load the community college equivalency table once, sorted by Rutgers course code.
 
-            sections = course.get('sections', [])
-        
-            for section in sections:
-                instructors = section.get('instructors', [])
-                
-                # Handle multiple instructors per section
-                for instructor in instructors:
-                    instructor_name = instructor.get('name', '')  
-                    if instructor_name not in self.instructors_courses:
-                        self.instructors_courses[instructor_name] = []
-
-                    # Store both title and course string
-                    course_info = {'title': title, 'courseString': course_string}
-                    if course_info not in self.instructors_courses[instructor_name]:
-                        self.instructors_courses[instructor_name].append(course_info)
+        Args:
+            equivalencies_path (str): Path to the equivalency CSV file.
+        """
+        self.equivalencies = self.load_equivalencies(equivalencies_path)
+
+    # load equivalency mappings
+    @staticmethod
+    def load_equivalencies(equivalencies_path):
+        """
+        Read the equivalency table into typed columns.
+
+        The columns are stored next to the CSV as a .npz file and loaded from there while
+        the CSV is unchanged, so the CSV is only parsed after it changes.
+
+        Args:
+            equivalencies_path (str): Path to the equivalency CSV file.
+
+        Returns:
+            equivalency_table: Table whose lookups are binary searches on the course code.
+        """
+        return equivalency_table.load(equivalencies_path, os.path.splitext(equivalencies_path)[0] + '.npz')
+
+    # current versions of the data files
+    def data_files_signature(self):
+        """
+        Identify the current versions of the course, equivalency and local vector index files.
+
+        Returns:
+            tuple: (mtime_ns, size) of each file, None for a missing file.
+        """
+        paths = [self.courses_data_path, self.equivalencies_path]
+        if self.vector_backend == "local":
+            paths.append(f"{self.vector_index_path}.npy")
+        return tuple(course_catalog.file_signature(path) for path in paths)
+
+    def _load_data(self):
+        """Build a new catalog, equivalency index and local vector index from the data files."""
+        catalog = course_catalog.load(self.courses_data_path, self.catalog_snapshot_path)
+        equivalencies = self.load_equivalencies(self.equivalencies_path)
+        equivalencies.build_reverse_index()
+        index = local_vector_index.load(self.vector_index_path) if self.vector_backend == "local" else None
+        return catalog, equivalencies, index, self.read_default_term()
+
+    # reload data files without restarting
+    async def reload_data(self, force=False):
+        """
+        Reload the course and equivalency data (and the local vector index) if their files changed.
+
+        The new catalog and indexes are built on the search thread pool while requests keep
+        being served from the current ones, then swapped in by reference without awaiting in
+        between, so no request waits for the rebuild or sees half-built data.
+
+        Args:
+            force (bool, optional): Reload even if the files look unchanged. Defaults to False.
+
+        Returns:
+            bool: True if new data was swapped in.
+        """
+        async with self.reload_lock:
+            signature = self.data_files_signature()
+            if not force and signature == self.data_signature:
+                return False
+
+            loop = asyncio.get_running_loop()
+            catalog, equivalencies, index, default_term = await loop.run_in_executor(self.executor, self._load_data)
+
+            retired = self.equivalencies.college_rows.cache_info()
+            self.retired_row_hits += retired.hits
+            self.retired_row_misses += retired.misses
+
+            self.catalog = catalog
+            self.default_term = default_term
+            self.equivalencies = equivalencies
+            if index is not None:
+                self._index = index
+            self.data_signature = signature
+            self.data_version += 1
+
+            print(f"Reloaded course data: {len(catalog.courses)} courses, data version {self.data_version}")
+            return True
+
+    # watch data files for changes
+    async def watch_data_files(self):
+        """
+        Reload the data whenever its files change, checking every reload_interval seconds.
+
+        A change is only picked up once the files have stayed the same for a whole interval,
+        so a file that is still being written is not loaded.
+        """
+        pending = None
+        while True:
+            await asyncio.sleep(self.reload_interval)
+
+            signature = self.data_files_signature()
+            if signature == self.data_signature or signature != pending:
+                pending = signature
+                continue
+
+            try:
+                await self.reload_data()
+            except Exception as e:
+                self.metrics.count_error('data_reload', e)
+                print(f"Error reloading course data: {str(e)}")
+
+    def start_data_watcher(self):
+        """Start watching the data files in the running event loop, unless DATA_RELOAD_INTERVAL is 0."""
+        if self.reload_interval > 0 and self.watch_task is None:
+            self.watch_task = asyncio.get_running_loop().create_task(self.watch_data_files())
+
+    # term of the default course data
+    def read_default_term(self):
+        """
+        Find which term and campus the default course data holds.
+
+        Reads the request parameters that scripts/get_course_data.py records next to the data file.
+
+        Returns:
+            str: Shard name such as '2025-9-NB', or None if the data file has no metadata.
+        """
+        metadata_path = os.path.splitext(self.courses_data_path)[0] + '.meta.json'
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as metadata_file:
+                params = json.load(metadata_file)['params']
+            return term_key(params['year'], params['term'], params['campus'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    # list the terms that can be searched
+    def available_terms(self):
+        """
+        List the terms that have course data: the default data and every shard in term_data_dir.
+
+        Returns:
+            list: Sorted shard names.
+        """
+        terms = {self.default_term} if self.default_term else set()
+        if os.path.isdir(self.term_data_dir):
+            for file_name in os.listdir(self.term_data_dir):
+                name, extension = os.path.splitext(file_name)
+                if extension == '.json' and TERM_KEY_PATTERN.fullmatch(name):
+                    terms.add(name)
+        return sorted(terms)
+
+    # get the catalog of a term
+    async def get_term_catalog(self, term=None):
+        """
+        Get the catalog for a term, loading its shard on first use.
+
+        Shards are loaded on the search thread pool (through a snapshot built in a child process,
+        like the default catalog) and kept in a small LRU. A shard whose file changed is loaded again.
+
+        Args:
+            term (str, optional): Shard name such as '2025-1-NK'. None, or the default term,
+                selects the default catalog.
+
+        Returns:
+            course_catalog: The term's catalog, or None if there is no data for the term.
+        """
+        if not term or term == self.default_term:
+            return self.catalog
+        if not TERM_KEY_PATTERN.fullmatch(term):
+            return None
+
+        shard_path = os.path.join(self.term_data_dir, f"{term}.json")
+        source = course_catalog.file_signature(shard_path)
+        if source is None:
+            self.term_catalogs.pop(term, None)
+            return None
+
+        async with self.term_lock:
+            # Another request may have loaded the shard while this one waited
+            catalog = self.term_catalogs.get(term)
+            if catalog is None or catalog.source != source:
+                snapshot_path = os.path.splitext(shard_path)[0] + '.snapshot.pkl' if self.catalog_snapshot_path else None
+                loop = asyncio.get_running_loop()
+                catalog = await loop.run_in_executor(self.executor, course_catalog.load, shard_path, snapshot_path)
+                self.term_catalogs[term] = catalog
+
+            self.term_catalogs.move_to_end(term)
+            while len(self.term_catalogs) > self.term_cache_size:
+                self.term_catalogs.popitem(last=False)
+            return catalog
 
     # format instructor name
     def _format_instructor_name(self, name) -> str:
         """Formats instructor names into a more readable 'Firstname Lastname' format.
-        
-        Handles 'LASTNAME, FIRSTNAME' and 'LASTNAME' formats, and returns 'TBA' for unknown instructors.
 
         Args:
             name (str): The instructor's name as a string.
@@ -149,67 +451,136 @@ class course_search:
         Returns:
             str: The formatted name.
         """
-        if not name or name == 'UNKNOWN':
-            return 'TBA'
-        
-        # Handle "LASTNAME, FIRSTNAME" format
-        if ',' in name:
-            parts = []
-            for p in name.split(','):
-                parts.append(p.strip())
-
-            if len(parts) == 2:
-                # Title-case both parts and join as "Firstname Lastname"
-                return f"{parts[1].title()} {parts[0].title()}"
-        
-        # Handle "LASTNAME" format (or any other format) by just title-casing it
-        return name.title()
+        return format_instructor_name(name)
 
     def generate_embeddings(self, text):
         """
         Generate embeddings for a given text using Google's text-embedding-004.
 
+        Embeddings are cached on the normalized text, so repeated queries skip the API call.
+
         Args:
             text (str): The text to generate embeddings for.
 
         Returns:
             numpy.ndarray: The generated embeddings.
         """
+        cached = self.embedding_cache.get(text)
+        if cached is not None:
+            return cached
+
+        return self._embed_uncached(text)
+
+    def _embed_uncached(self, text):
+        """Call the embedding API for a query and cache the result."""
         try:
-            result = genai.embed_content(
+            result = self.genai.embed_content(
                 model="models/text-embedding-004",
-                content=text,
+                content=self.embedding_cache.normalize(text),
                 task_type="retrieval_query"  # For search queries
             )
-            return np.array(result['embedding'])
+            embedding = np.array(result['embedding'])
+            self.embedding_cache.set(text, embedding)
+            return embedding
         except Exception as e:
+            self.metrics.count_error('embed', e)
             print(f"Error generating embedding: {e}")
             # Fallback to zeros if embedding fails
             return np.zeros(768)  # text-embedding-004 has 768 dimensions
 
+    async def run_blocking(self, func, *args, timeout=None, **kwargs):
+        """
+        Run a blocking call on the search thread pool without blocking the event loop.
+
+        Args:
+            func (callable): The blocking function.
+            *args: Positional arguments for func.
+            timeout (float, optional): Seconds to wait before raising asyncio.TimeoutError.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            The return value of func.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+    async def generate_embeddings_async(self, text):
+        """
+        Generate embeddings for a given text without blocking the event loop.
+
+        Cached embeddings are returned directly; otherwise the API call runs on the search thread pool.
+
+        Args:
+            text (str): The text to generate embeddings for.
+
+        Returns:
+            numpy.ndarray: The generated embeddings.
+        """
+        cached = self.embedding_cache.get(text)
+        if cached is not None:
+            return cached
+
+        return await self.run_blocking(self._embed_uncached, text, timeout=self.embed_timeout)
+
+    def cache_stats(self):
+        """
+        Report hit and miss counters for the controller's caches.
+
+        The equivalency row counters include the tables replaced by earlier reloads.
+
+        Returns:
+            dict: Cache name mapped to its statistics.
+        """
+        rows = self.equivalencies.college_rows.cache_info()
+        hits = self.retired_row_hits + rows.hits
+        misses = self.retired_row_misses + rows.misses
+        lookups = hits + misses
+        return {
+            'embeddings': self.embedding_cache.stats(),
+            'distances': self.distances_cache.stats(),
+            'equivalency_rows': {
+                'size': rows.currsize,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0
+            }
+        }
+
     # search courses by title
-    def search_courses(self, query, top_k):
+    async def search_courses(self, query, top_k):
         """
         Search for courses based on a given text user inputs
 
+        The embedding and the Pinecone query run on the search thread pool with per-stage timeouts;
+        the local vector index is searched in-process.
+
         Args:
             query (str): The text to search for.
             top_k (int): The number of top results to return.
 
         Returns:
-            list: A list of course objects matching the search query.
+            list: A list of course records matching the search query.
         """
         try:
 
             # Generate the embedding for the search query
-            query_embedding = self.generate_embeddings(query)
+            with self.metrics.time('embed'):
+                query_embedding = await self.generate_embeddings_async(query)
 
-            # Perform the search in Pinecone
-            result = self.index.query(
-                vector=query_embedding.tolist(),  
-                top_k=top_k,
-                include_metadata=True
-            )
+            # Perform the search in the vector index (Pinecone or local)
+            with self.metrics.time('vector_query'):
+                if self.vector_backend == "local":
+                    result = self.index.query(vector=query_embedding, top_k=top_k, include_metadata=True)
+                else:
+                    # The index property may build the Pinecone client, so resolve it on the pool too
+                    result = await self.run_blocking(
+                        lambda **kwargs: self.index.query(**kwargs),
+                        vector=query_embedding.tolist(),
+                        top_k=top_k,
+                        include_metadata=True,
+                        timeout=self.vector_query_timeout
+                    )
 
             if not result['matches']:
                 return []
@@ -232,6 +603,9 @@ class course_search:
 
             return courses
         
+        except asyncio.TimeoutError:
+            print(f"Timed out searching courses for: {query}")
+            return []
         except Exception as e:
             print(f"Error in search_courses: {str(e)}")
             return []
@@ -239,7 +613,7 @@ class course_search:
     # get distance between two locations
     async def get_distance(self, your_location, college_data):
         """
-        Calculate the driving distance between two locations using the Mapbox Directions API.
+        Calculate the driving distance between two locations using the Mapbox Matrix API.
 
         Args:
             your_location (tuple): A tuple containing the latitude and longitude of the user's location.
@@ -253,72 +627,124 @@ class course_search:
         if your_location is None or college_data is None:
             return None
 
-        community_college_location = college_data
-        
-        # Mapbox API URL for Directions
-        base_url = "https://api.mapbox.com/directions/v5/mapbox/driving"
-        
-        # Coordinates as Longitude, Latitude format
-        start = f"{your_location[1]},{your_location[0]}"  
-        end = f"{community_college_location[1]},{community_college_location[0]}"  
-        
-        access_token = self.mapbox_access_token
+        distances = await self.mapbox_client.driving_miles(your_location, [college_data])
+        return distances[0]
 
-        # Mapbox API URL for Directions
-        url = f"{base_url}/{start};{end}?access_token={access_token}&geometries=geojson&overview=simplified&annotations=distance"
-        
-        # Asynchronously make the request
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
+    async def close(self):
+        """Stop the data watcher and release pooled HTTP sessions and the search thread pool."""
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            self.watch_task = None
+        await self.mapbox_client.close()
+        self.executor.shutdown(wait=False)
+
+    # estimate distances to all community colleges without network access
+    def estimate_college_distances(self, your_location):
+        """
+        Estimate driving distances to all community colleges from great-circle distances.
+
+        Computes every distance in one vectorized call and scales it by the detour factor,
+        so it needs no network access.
+
+        Args:
+            your_location (tuple): A tuple containing the latitude and longitude of the user's location.
+
+        Returns:
+            dict: A dictionary mapping community college names to estimated driving distances in miles.
+        """
+        distances = estimate_driving_miles(your_location, self.college_coordinates, self.detour_factor)
+        return dict(zip(self.college_names, distances))
 
-                # Get the data from the response
-                data = await response.json()
+    # get driving distances to all community colleges from Mapbox
+    async def get_mapbox_college_distances(self, your_location):
+        """
+        Get driving distances from a location to all community colleges in one Mapbox Matrix request.
 
-                # Get the distance in meters
-                distance_in_meters = data['routes'][0]['legs'][0]['distance']
+        Colleges Mapbox has no route to, or all colleges if the request fails, keep their estimated distance.
 
-                # Convert meters to miles (1 mile = 1609.34 meters)
-                distance_in_miles = round((distance_in_meters / 1609.34), 2)
+        Args:
+            your_location (tuple): A tuple containing the latitude and longitude of the user's location.
 
-                return distance_in_miles
+        Returns:
+            dict: A dictionary mapping community college names to their driving distances in miles.
+        """
+        college_distances = self.estimate_college_distances(your_location)
 
-     #precompute distances to all community colleges
+        try:
+            destinations = [self.community_colleges[college] for college in self.college_names]
+            distances = await self.mapbox_client.driving_miles(your_location, destinations)
+        except Exception as e:
+            self.metrics.count_error('mapbox', e)
+            print(f"Error getting Mapbox distances: {e}")
+            return college_distances
+
+        for college, distance in zip(self.college_names, distances):
+            if distance is not None:
+                college_distances[college] = distance
+
+        return college_distances
+
+    async def _refine_college_distances(self, cell, origin, college_distances):
+        """Replace estimated distances with Mapbox driving distances in place, re-rank them and update the cache."""
+        try:
+            ranked = rank_by_distance({**college_distances, **await self.get_mapbox_college_distances(origin)})
+            # Sessions hold this dictionary, so reorder it in place rather than replacing it
+            college_distances.clear()
+            college_distances.update(ranked)
+            self.distances_cache.set(cell, college_distances)
+        except Exception as e:
+            self.metrics.count_error('distance_refine', e)
+            print(f"Error refining college distances: {e}")
+
+    #precompute distances to all community colleges
     async def get_all_college_distances(self, your_location):
         """
-        Asynchronously calculates the driving distance from a given location to all community colleges.
+        Calculates the driving distance from a given location to all community colleges.
 
-        This method leverages asyncio to perform multiple distance calculations concurrently,
-        improving performance by reducing total wait time for API responses.
+        Depending on the distance mode, distances are estimated locally, fetched from Mapbox,
+        or estimated locally and then refined with Mapbox in the background. Locations are snapped
+        to a grid cell and distances are computed from the cell center, so nearby users share
+        one cached result. The result is ordered nearest college first, so each grid cell's
+        college ranking is computed once and every search reuses it.
 
         Args:
             your_location (tuple): A tuple containing the latitude and longitude of the user's location.
 
         Returns:
-            dict: A dictionary mapping community college names to their calculated driving distances in miles.
-                  Returns an empty dictionary if the user's location is not provided.
+            dict: A dictionary mapping community college names to their calculated driving distances in miles,
+                  nearest first. Returns an empty dictionary if the user's location is not provided.
         """
         if not your_location:
             return {}
 
-        # Check cache for pre-computed distances
-        if your_location in self.distances_cache:
-            return self.distances_cache[your_location]
+        try:
+            cell = self.distances_cache.cell(your_location)
+        except (TypeError, ValueError, IndexError):
+            return {}
 
-        colleges = self.community_colleges.keys()
-        
-        # Create a list of tasks for getting distances
-        tasks = [self.get_distance(your_location, self.community_colleges[college]) for college in colleges]
-        
-        # Run all tasks concurrently
-        distances = await asyncio.gather(*tasks)
-        
-        # Create a dictionary mapping college names to distances
-        college_distances = dict(zip(colleges, distances))
-        
-        # Cache the results for future requests
-        self.distances_cache[your_location] = college_distances
+        with self.metrics.time('distance_fetch'):
+            # Check cache for pre-computed distances
+            college_distances = self.distances_cache.get(cell)
+            if college_distances is not None:
+                return college_distances
 
-        return college_distances
+            origin = self.distances_cache.cell_center(cell)
+
+            if self.distance_mode == "mapbox":
+                college_distances = rank_by_distance(await self.get_mapbox_college_distances(origin))
+            else:
+                college_distances = rank_by_distance(self.estimate_college_distances(origin))
+
+                if self.distance_mode == "refine" and self.mapbox_access_token:
+                    # Keep a reference so the task isn't garbage collected before it finishes
+                    task = asyncio.create_task(self._refine_college_distances(cell, origin, college_distances))
+                    self.refine_tasks.add(task)
+                    task.add_done_callback(self.refine_tasks.discard)
+
+            # Cache the results for future requests
+            self.distances_cache.set(cell, college_distances)
+
+            return college_distances
 
     # get top 5 course equivalencies by distance
     async def get_top_5_course_equivalencies_by_distance(self, course_code, college_distances):
@@ -328,65 +754,97 @@ class course_search:
 
         Args:
             course_code (str): Course code to find equivalencies for
-            college_distances (dict): Precomputed distances to community colleges. Can be None/empty if no location.
+            college_distances (dict): Precomputed distances to community colleges, nearest first as returned by
+                get_all_college_distances. Can be None/empty if no location.
 
         Returns:
             list: Course equivalencies with distance information (or without if location unavailable)
         """
-        equivalencies = pd.read_csv('data/community_to_college.csv')
-        equivalencies = equivalencies[equivalencies['equivalency'] == course_code]
+        # First row per community college, keyed by college in name order
+        equivalencies = self.equivalencies.college_rows(course_code)
 
-        if equivalencies.empty:
+        if not equivalencies:
             return []
 
         # If we have distance information, use it for sorting
         if college_distances:
-            # Use precomputed distances to save computation time
-            distances = []
-            for college in equivalencies['community_college']:
-                dist = college_distances.get(college)
-                # Replace infinite or missing distances with None so they serialize to null in JSON
-                if dist is None or (isinstance(dist, (int, float)) and math.isinf(dist)):
-                    distances.append(None)
-                else:
-                    distances.append(dist)
-    
-            equivalencies['Distance'] = distances
-            
-            unique_colleges = set()
+            # The distance table is already ranked nearest first, so walk it until five colleges offer the course
             top_5 = []
-            
-            #Get top 5 unique colleges by distance
-            for _, row in equivalencies.sort_values('Distance').iterrows():
-                college = row['community_college']
-                if college not in unique_colleges:
-                    unique_colleges.add(college)
-
-                    row_data = row.to_dict()
-                    # Convert pandas NaN to None for JSON safety
-                    if pd.isna(row_data.get('Distance')):
-                        row_data['Distance'] = None
-
-                    top_5.append(row_data)
-                    if len(top_5) == 5:
-                        break
-        else:
-            # No location available - return all unique equivalencies without distance sorting
-            equivalencies['Distance'] = None
-            unique_colleges = set()
-            all_equivalencies = []
-
-            for _, row in equivalencies.sort_values('community_college').iterrows():
-                college = row['community_college']
-                if college not in unique_colleges:
-                    unique_colleges.add(college)
-                    row_data = row.to_dict()
-                    row_data['Distance'] = None
-                    all_equivalencies.append(row_data)
-
-            return all_equivalencies
-
-        return top_5
+            for college, dist in college_distances.items():
+                row = equivalencies.get(college)
+                if row is None:
+                    continue
+                # Missing and infinite distances are ranked last, after every finite one
+                if dist is None or math.isinf(dist):
+                    break
+                top_5.append(dict(row, Distance=dist))
+                if len(top_5) == 5:
+                    return top_5
+
+            # Colleges without a distance go last, in name order, with None so they serialize to null in JSON
+            for college, row in equivalencies.items():
+                if len(top_5) == 5:
+                    break
+                dist = college_distances.get(college)
+                if dist is None or math.isinf(dist):
+                    top_5.append(dict(row, Distance=None))
+
+            return top_5
+
+        # No location available - return all unique equivalencies without distance sorting
+        return [dict(row, Distance=None) for row in equivalencies.values()]
+
+    # find what a community college course transfers as
+    def reverse_equivalencies(self, community_college, code, catalog=None):
+        """
+        Find the Rutgers courses a community college course transfers as.
+
+        Looks the course up in the equivalency table's reverse index, without scanning the
+        table, and joins each Rutgers course code to its course record.
+
+        Args:
+            community_college (str): Community college name, in any letter case.
+            code (str): Community college course code, e.g. 'BIO 101'.
+            catalog (course_catalog, optional): Catalog to join with. Defaults to the default catalog.
+
+        Returns:
+            list: One dictionary per Rutgers course, with the course details (None when it is not in
+                the catalog), the community college course, the credits and the Rutgers schools
+                that accept it; None if the community college is unknown.
+        """
+        catalog = catalog or self.catalog
+        table = self.equivalencies
+
+        rows = table.find_reverse(community_college, code)
+        if rows is None:
+            return None
+
+        results = {}
+        for row in rows:
+            entry = table.row(row)
+            course_code = normalize_course_code(entry['equivalency'])
+            result = results.get(course_code)
+
+            if result is None:
+                record = catalog.courses_by_code.get(course_code)
+                result = results[course_code] = {
+                    'community_college': entry['community_college'],
+                    'code': entry['code'],
+                    'name': entry['name'],
+                    'credits': entry['credits'],
+                    'transfer_credit': entry['transfer_credit'],
+                    'equivalency': entry['equivalency'],
+                    'course_number': record.course_number if record else None,
+                    'title': record.title if record else None,
+                    'prerequisites': record.prerequisites if record else None,
+                    'synopsisUrl': record.synopsis_url if record else None,
+                    'schools': []
+                }
+
+            if entry['college'] and entry['college'] not in result['schools']:
+                result['schools'].append(entry['college'])
+
+        return list(results.values())
 
     async def search_by_title(self, title, college_distances):
         """
@@ -394,60 +852,97 @@ class course_search:
 
         Args:
             title (str): Title of the course to search for
-            location (tuple): User's location as (latitude, longitude) tuple
+            college_distances (dict): Precomputed distances to community colleges. Can be None/empty if no location.
 
         Returns:
             list: List of course objects that match the title
         """
         try:
             
-            close_matches = self.search_courses(title, top_k = 5)
-            
-
-            matching_courses = []
-            course_titles = []
+            close_matches = await self.search_courses(title, top_k = 5)
 
+            tasks = []
             for match in close_matches:
-                
-                # Remove colon from course code for lookup
-                course_code = match.get('courseString', '').replace(':', '')
-                matching_course = self.courses_by_code.get(course_code)
-
-                print(matching_course)
-                if matching_course is None:
-                    continue
-              
-                course_info = await self.extract_course_data(matching_course, college_distances)
-                matching_courses.append(course_info)
-                course_titles.append(match.get('title', ''))
+                tasks.append(self.extract_course_data(match, college_distances))
             
-            return matching_courses
+            with self.metrics.time('detail_extraction'):
+                return list(await asyncio.gather(*tasks))
             
         except Exception as e:
             print(f"Error in search_by_title: {str(e)}")
             raise
 
+    # find course codes matching a search term
+    def find_course_codes(self, course_code, prefix=False, catalog=None):
+        """
+        Look up course codes matching a search term using the code indexes.
+
+        Terms without a colon match the end of the course code (e.g. "111" or "198111"). Terms
+        containing a colon, or any term when prefix is True, match the start of the full or
+        subject:number code (e.g. "198:1" or "01:198").
+
+        Args:
+            course_code (str): Course code or partial course code to search for.
+            prefix (bool, optional): Match the start of the code instead of the end. Defaults to False.
+            catalog (course_catalog, optional): Catalog to search. Defaults to the default catalog.
+
+        Returns:
+            list: Matching course codes with colons removed, in catalog order.
+        """
+        catalog = catalog or self.catalog
+        term = course_code.strip()
+        if not term:
+            return []
+
+        if prefix or ':' in term:
+            return catalog.code_prefix_index.get(term, [])
+        return catalog.code_suffix_index.get(term, [])
+
     # search by course code
-    async def search_by_code(self, course_code, college_distances):
+    async def search_by_code(self, course_code, college_distances, prefix=False, catalog=None):
         """
         Search for courses by code.
 
         Args:
             course_code (str): Course code to search for.
-            location (tuple, optional): User's location as (latitude, longitude) tuple.
+            college_distances (dict): Precomputed distances to community colleges. Can be None/empty if no location.
+            prefix (bool, optional): Match the start of the code instead of the end. Defaults to False.
+            catalog (course_catalog, optional): Catalog to search. Defaults to the default catalog.
 
         Returns:
             list: List of course objects that match the code.
         """
-        matching_courses = []
+        catalog = catalog or self.catalog
+        codes = self.find_course_codes(course_code, prefix, catalog)
+
+        tasks = [self.extract_course_data(catalog.courses_by_code[code], college_distances) for code in codes]
+        with self.metrics.time('detail_extraction'):
+            return list(await asyncio.gather(*tasks))
+
+    # suggest course codes for type-ahead
+    def suggest_course_codes(self, partial_code, limit=10, catalog=None):
+        """
+        Suggest courses whose code starts with a partial code, for type-ahead.
 
-        for full_code, course in self.courses_by_code.items():
-            if full_code.endswith(course_code):
-                course_info = await self.extract_course_data(course, college_distances)
-                matching_courses.append(course_info)
-        return matching_courses
+        Args:
+            partial_code (str): The start of a course code, e.g. '198:1'.
+            limit (int, optional): Maximum number of suggestions. Defaults to 10.
+            catalog (course_catalog, optional): Catalog to search. Defaults to the default catalog.
 
-    async def search_by_professor(self, professor_name):
+        Returns:
+            list: Dictionaries with the course number and title of each suggestion.
+        """
+        catalog = catalog or self.catalog
+        suggestions = []
+        for code in self.find_course_codes(partial_code, prefix=True, catalog=catalog)[:limit]:
+            course = catalog.courses_by_code[code]
+            suggestions.append({
+                'course_number': course.course_number,
+                'title': course.title
+            })
+        return suggestions
+
+    async def search_by_professor(self, professor_name, catalog=None):
         """Search for courses taught by a specific professor with suggestions.
         
         If an exact match is found, it returns the professor's courses. 
@@ -455,20 +950,19 @@ class course_search:
         
         Args:
             professor_name (str): The name of the professor to search for.
+            catalog (course_catalog, optional): Catalog to search. Defaults to the default catalog.
             
         Returns:
             list: A list of dictionaries, either containing professor data or suggestions.
         """
+        catalog = catalog or self.catalog
         search_term = professor_name.lower().strip()
         
         if not search_term:
             return []
 
         # Find professors where the search term is part of their name
-        exact_matches = []
-        for prof in self.instructors_courses.keys():
-            if search_term in prof.lower():
-                exact_matches.append(prof)
+        exact_matches = catalog.professor_index.search(search_term)
 
         # If we found direct matches, return their data
         if exact_matches:
@@ -476,12 +970,12 @@ class course_search:
             for prof_name in exact_matches:
                 results.append({
                     'professor': self._format_instructor_name(prof_name),
-                    'courses': self.instructors_courses.get(prof_name, [])
+                    'courses': catalog.instructors_courses.get(prof_name, [])
                 })
             return results
 
         # If no direct matches, find suggestions
-        suggestions = self._find_similar_professors(search_term)
+        suggestions = self._find_similar_professors(search_term, catalog=catalog)
         if suggestions:
             formatted_suggestions = []
             for s in suggestions:
@@ -494,77 +988,43 @@ class course_search:
             
         return []
 
-    def _find_similar_professors(self, name: str, threshold=0.7):
-        """Finds professors with names similar to the search term using difflib.
+    def _find_similar_professors(self, name: str, threshold=0.7, catalog=None):
+        """Finds professors with names similar to the search term using the n-gram index.
         
         Args:
             name (str): The name to find similarities for.
             threshold (float): The cutoff for similarity score (0.0 to 1.0).
+            catalog (course_catalog, optional): Catalog to search. Defaults to the default catalog.
             
         Returns:
             list: A list of names deemed similar to the input name.
         """
-   
-        all_professors = list(self.instructors_courses.keys())
-        
-        # Get close matches using difflib
-        similar_matches = difflib.get_close_matches(name, all_professors, n=5, cutoff=threshold)
-        
-        return similar_matches
+        return (catalog or self.catalog).professor_index.similar(name, limit=5, cutoff=threshold)
 
     async def extract_course_data(self, course, college_distances=None):
         """
-        Extract course data from a course object.
+        Extract course data from a course record.
+
+        Uses the record's precomputed fields and only looks up the location-dependent equivalencies.
 
         Args:
-           course (dict): A course object to extract data from.
+           course (course_record): A course record, or a raw course object, to extract data from.
            college_distances (dict, optional): Precomputed distances to community colleges.
 
         Returns:
             dict: Extracted course data that contains the course number, title, prerequisites, and instructors.
         """
         try:
-       
-            course_string = course.get('courseString')
-            course_title = course.get('title')
-            preq = course.get('preReqNotes') or "No prerequisites"
-
-            # Clean em tags from prerequisites
-            preq = self.remove_em_tags(preq)
-            synopsis_url = course.get('synopsisUrl', '')
+            record = course
+            if not isinstance(record, course_record):
+                record = course_record.from_course(course, self._format_instructor_name, self.remove_em_tags)
 
-            sections = course.get('sections', [])
-            instructors_for_course = []
+            # Get equivalencies (with or without distance info); timed without a context manager, since it runs once per result
+            start = time.perf_counter()
+            course_equivalencies = await self.get_top_5_course_equivalencies_by_distance(record.course_code, college_distances)
+            self.join_histogram.observe(time.perf_counter() - start)
 
-            # Loops through each section to extract the instructors
-            for section in sections:
-                instructor_for_section = section.get('instructors', [])
-
-                if not instructor_for_section:
-                    instructors_for_course.append([{'name': 'TBA'}])
-                else:
-                    formatted_instructors = []
-                    for i in instructor_for_section:
-                        formatted_instructors.append({'name': self._format_instructor_name(i['name'])})
-                    
-                    if formatted_instructors not in instructors_for_course:
-                        instructors_for_course.append(formatted_instructors)
-
-            course_code = course_string.replace(':', '')
-
-            # Get equivalencies (with or without distance info)
-            course_equivalencies = await self.get_top_5_course_equivalencies_by_distance(course_code, college_distances)
-
-            course_data = {
-                'title': course_title,
-                'course_number': course_string,
-                'instructors': instructors_for_course,
-                'prerequisites': preq,
-                'equivalencies': course_equivalencies,
-                'synopsisUrl': synopsis_url,
-            }
-
-            return course_data
+            return record.to_dict(course_equivalencies)
         except Exception as e:
             print(f"Error in extract_course_data: {str(e)}")
             import traceback
@@ -584,15 +1044,11 @@ class course_search:
             return []
 
         course = self.courses_by_code[course_code]
-        sections = course.get('sections', [])
         instructors_for_course = []
 
-        # Loops through each section to extract the instructors
-        for section in sections:
-
-            instructor_for_section = section.get('instructors', [])
-            if instructor_for_section not in instructors_for_course:
-                instructors_for_course.append(instructor_for_section)
+        # One list of instructors per distinct section group
+        for names in course.section_instructors:
+            instructors_for_course.append([{'name': name} for name in names])
 
         return instructors_for_course
 
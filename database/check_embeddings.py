@@ -0,0 +1,174 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generate_embeddings
+from generate_embeddings import build_embeddings, fake_embedder, load_pending_deletes
+from vector_store import local_vector_index
+
+
+class fake_index:
+    """
+    In-memory stand-in for the Pinecone index, recording every upsert and delete.
+
+    Attributes:
+        vectors (dict): Course id mapped to its upserted values
+        upserted (list): Ids of every upserted vector, in call order
+        deleted (list): Ids of every delete call, in call order
+        fail_upserts (bool): Raise from upsert, like an unreachable Pinecone
+        fail_deletes (bool): Raise from delete, like an unreachable Pinecone
+    """
+
+    def __init__(self):
+        self.vectors = {}
+        self.upserted = []
+        self.deleted = []
+        self.fail_upserts = False
+        self.fail_deletes = False
+
+    def upsert(self, vectors):
+        if self.fail_upserts:
+            raise ConnectionError("Pinecone unavailable")
+        for vector in vectors:
+            self.vectors[vector['id']] = vector['values']
+            self.upserted.append(vector['id'])
+
+    def delete(self, ids):
+        if self.fail_deletes:
+            raise ConnectionError("Pinecone unavailable")
+        for course_id in ids:
+            self.vectors.pop(course_id, None)
+            self.deleted.append(course_id)
+
+
+class failing_embedder(fake_embedder):
+    """fake_embedder that fails for every batch containing one of the given titles."""
+
+    def __init__(self, fail_titles):
+        super().__init__()
+        self.fail_titles = set(fail_titles)
+
+    def embed(self, texts):
+        if self.fail_titles.intersection(texts):
+            raise ConnectionError("Gemini unavailable")
+        return super().embed(texts)
+
+
+def courses(titles):
+    """Course objects as in the course data file, from a {course code: title} mapping."""
+    return [{'courseString': code, 'title': title} for code, title in titles.items()]
+
+
+def run(titles, embedder, index, path):
+    """Run one incremental embedding pass without retries or progress delays."""
+    return build_embeddings(courses(titles), embedder, index, path, batch_size=2, concurrency=2, max_retries=0)
+
+
+def check(condition, description, failures):
+    """Print one check result and remember failures."""
+    print(f"{'ok  ' if condition else 'FAIL'} {description}")
+    if not condition:
+        failures.append(description)
+
+
+def main():
+    """Check the incremental embedding path offline with fake_embedder and an in-memory index."""
+
+    # Retries would only slow the failure cases down
+    generate_embeddings.time.sleep = lambda seconds: None
+
+    failures = []
+    titles = {f"01:198:{100 + i}": f"Course {i}" for i in range(7)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'course_vectors')
+        index = fake_index()
+
+        counts = run(titles, fake_embedder(), index, path)
+        check(counts['embedded'] == 7 and sorted(index.vectors) == sorted(titles),
+              "first run embeds and upserts every course", failures)
+
+        embedder = fake_embedder()
+        index.upserted.clear()
+        counts = run(titles, embedder, index, path)
+        check(counts['unchanged'] == 7 and embedder.requests == 0 and not index.upserted,
+              "second run skips unchanged courses without API calls", failures)
+
+        titles['01:198:101'] = "Course 1 renamed"
+        counts = run(titles, fake_embedder(), index, path)
+        check(counts['embedded'] == 1 and index.upserted == ['01:198:101'],
+              "a changed title re-embeds only that course", failures)
+
+        stored = local_vector_index.load(path)
+        before = stored.vectors[stored.ids.index('01:198:102')].copy()
+        titles['01:198:102'] = "Course 2 renamed"
+        counts = run(titles, failing_embedder(["Course 2 renamed"]), index, path)
+        stored = local_vector_index.load(path)
+        position = stored.ids.index('01:198:102')
+        check(counts['failed'] >= 1 and np.array_equal(stored.vectors[position], before)
+              and stored.metadata[position]['content_hash'] is None,
+              "a failed embedding keeps the previous vector and clears its hash", failures)
+
+        counts = run(titles, fake_embedder(), index, path)
+        check(counts['embedded'] >= 1 and counts['failed'] == 0,
+              "the next run retries the failed embedding", failures)
+
+        del titles['01:198:103']
+        index.fail_deletes = True
+        counts = run(titles, fake_embedder(), index, path)
+        check(counts['delete_failed'] == 1 and '01:198:103' in index.vectors
+              and load_pending_deletes(path) == ['01:198:103'],
+              "a failed delete is kept as pending", failures)
+
+        index.fail_deletes = False
+        counts = run(titles, fake_embedder(), index, path)
+        check(counts['deleted'] == 1 and '01:198:103' not in index.vectors and load_pending_deletes(path) == [],
+              "the next run retries the pending delete", failures)
+
+        titles['01:198:104'] = "Course 4 renamed"
+        index.fail_upserts = True
+        counts = run(titles, fake_embedder(), index, path)
+        stored = local_vector_index.load(path)
+        metadata = stored.metadata[stored.ids.index('01:198:104')]
+        check(counts['failed'] == 1 and metadata['content_hash'] is not None
+              and metadata['pinecone_hash'] != metadata['content_hash'],
+              "a failed upsert keeps the new vector locally but not as upserted", failures)
+
+        index.fail_upserts = False
+        embedder = fake_embedder()
+        index.upserted.clear()
+        counts = run(titles, embedder, index, path)
+        check(counts['upserted'] == 1 and index.upserted == ['01:198:104'] and embedder.requests == 0,
+              "the next run upserts it without embedding it again", failures)
+
+        # A local-only run (VECTOR_BACKEND=local) leaves Pinecone behind
+        titles['01:198:105'] = "Course 5 renamed"
+        del titles['01:198:106']
+        counts = run(titles, fake_embedder(), None, path)
+        check(counts['embedded'] == 1 and counts['delete_pending'] == 1
+              and load_pending_deletes(path) == ['01:198:106'],
+              "a local-only run records its deletes as pending", failures)
+
+        embedder = fake_embedder()
+        index.upserted.clear()
+        counts = run(titles, embedder, index, path)
+        check(index.upserted == ['01:198:105'] and embedder.requests == 0,
+              "the next Pinecone run upserts what the local-only run embedded", failures)
+        check(counts['deleted'] == 1 and '01:198:106' not in index.vectors and load_pending_deletes(path) == [],
+              "and makes the deletes of the local-only run", failures)
+
+        check(sorted(local_vector_index.load(path).ids) == sorted(titles) == sorted(index.vectors),
+              "the local index and Pinecone hold exactly the current courses", failures)
+
+    if failures:
+        print(f"{len(failures)} checks failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
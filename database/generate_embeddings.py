@@ -1,103 +1,483 @@
 import os
+import sys
 import json
+import time
+import random
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 from tqdm import tqdm
 import dotenv
-from pinecone import Pinecone, ServerlessSpec
-import google.generativeai as genai
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vector_store import local_vector_index
 
 # Load environment variables
 dotenv.load_dotenv()
 
-# Initialize Google Gemini client
-google_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=google_api_key)
-
-# Initialize Pinecone client
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-pc = Pinecone(api_key=pinecone_api_key)
-
 # Pinecone index details
 index_name = "courses-gemini"
 dimension = 768  # text-embedding-004 uses 768 dimensions
 metric = "cosine"
 
-# Check if the index exists
-existing_indexes = []
-for index in pc.list_indexes():
-    existing_indexes.append(index.name)
-
-if index_name not in existing_indexes:
-    print(f"Index '{index_name}' does not exist. Creating index...")
-    pc.create_index(
-        name=index_name,
-        dimension=dimension,
-        metric=metric,
-        spec=ServerlessSpec(
-            cloud='aws', 
-            region='us-east-1'  
+embedding_model = "models/text-embedding-004"
+
+# Gemini embeds at most 100 texts per batch request; upserts are sent in chunks of the same size
+max_batch_size = 100
+upsert_batch_size = 100
+
+
+class gemini_embedder:
+    """
+    Embeds texts with Google's text-embedding-004, a whole batch per API request.
+
+    Attributes:
+        model (str): Embedding model name
+    """
+
+    def __init__(self, api_key, model=embedding_model):
+        """
+        Configure the Gemini client.
+
+        Args:
+            api_key (str): Google API key.
+            model (str, optional): Embedding model name. Defaults to text-embedding-004.
+        """
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model = model
+
+    def embed(self, texts):
+        """
+        Embed a batch of texts in one request.
+
+        Args:
+            texts (list): Texts to embed, at most max_batch_size.
+
+        Returns:
+            list: One embedding (list of floats) per text.
+        """
+        result = self.genai.embed_content(
+            model=self.model,
+            content=list(texts),
+            task_type="retrieval_document"  # For storing documents
         )
-    )
-    print(f"Index '{index_name}' created successfully!")
+        return result['embedding']
+
+
+class fake_embedder:
+    """
+    Offline stand-in for gemini_embedder, for tests and dry runs without an API key.
+
+    Each text gets a pseudo-random vector seeded by its hash, so the same text always
+    gets the same embedding.
+
+    Attributes:
+        model (str): Name recorded in content hashes, so fake and real embeddings never mix
+        dimension (int): Embedding size
+        requests (int): Number of embed calls made
+    """
+
+    model = "fake"
+
+    def __init__(self, dimension=dimension):
+        """
+        Initialize the embedder.
+
+        Args:
+            dimension (int, optional): Embedding size. Defaults to 768.
+        """
+        self.dimension = dimension
+        self.requests = 0
+
+    def embed(self, texts):
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts (list): Texts to embed.
 
-# Access the index
-index = pc.Index(index_name)
+        Returns:
+            list: One embedding (list of floats) per text.
+        """
+        self.requests += 1
+        embeddings = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+            embeddings.append(np.random.default_rng(seed).standard_normal(self.dimension).tolist())
+        return embeddings
 
-# Load the Rutgers courses data from JSON file
-with open('../data/rutgers_courses.json', 'r') as json_file:
-    courses_data = json.load(json_file)
 
-# Function to generate embeddings for a batch of texts using Google's text-embedding-004
-def generate_batch_embeddings(texts):
-    embeddings = []
-    for text in texts:
+# Hash of what gets embedded for a course, used to skip unchanged courses
+def content_hash(text, model):
+    """
+    Hash the embedded text together with the model that embeds it.
+
+    Args:
+        text (str): The text that is embedded for a course.
+        model (str): The embedding model name.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    return hashlib.sha256(f"{model}\n{text}".encode('utf-8')).hexdigest()
+
+
+# Call a function, retrying failures with exponential backoff and jitter
+def call_with_retry(func, *args, max_retries=4, base_delay=1.0, description="request"):
+    """
+    Call a function, retrying on any exception with exponential backoff.
+
+    Args:
+        func (callable): The function to call.
+        *args: Arguments for the function.
+        max_retries (int, optional): Retries after the first attempt. Defaults to 4.
+        base_delay (float, optional): Seconds to wait before the first retry. Defaults to 1.0.
+        description (str, optional): What is being called, for log messages.
+
+    Returns:
+        The function's return value. The last exception is raised once retries run out.
+    """
+    for attempt in range(max_retries + 1):
         try:
-            # Use Google's text-embedding-004 model
-            result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=text,
-                task_type="retrieval_document"  # For storing documents
-            )
-            embeddings.append(np.array(result['embedding']))
+            return func(*args)
         except Exception as e:
-            print(f"Error generating embedding for text: {text[:50]}... Error: {e}")
-            # Create a zero vector as fallback
-            embeddings.append(np.zeros(dimension))
-    return embeddings
+            if attempt == max_retries:
+                raise
+            delay = base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+            print(f"{description} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+# Connect to the Pinecone index, creating it if needed
+def get_pinecone_index():
+    """
+    Connect to the Pinecone index, creating it if it does not exist.
+
+    Returns:
+        The Pinecone index.
+    """
+    from pinecone import Pinecone, ServerlessSpec
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+
+    # Check if the index exists
+    existing_indexes = []
+    for existing_index in pc.list_indexes():
+        existing_indexes.append(existing_index.name)
+
+    if index_name not in existing_indexes:
+        print(f"Index '{index_name}' does not exist. Creating index...")
+        pc.create_index(
+            name=index_name,
+            dimension=dimension,
+            metric=metric,
+            spec=ServerlessSpec(
+                cloud='aws',
+                region='us-east-1'
+            )
+        )
+        print(f"Index '{index_name}' created successfully!")
+
+    return pc.Index(index_name)
+
+
+# Load the vectors and content hashes of the previous run from the local index
+def load_previous_vectors(local_index_path):
+    """
+    Load the previous run's local vector index.
+
+    Args:
+        local_index_path (str): Base path of the local vector index files.
+
+    Returns:
+        dict: Mapping of course ids to (vector, metadata), empty if there is no previous index.
+    """
+    try:
+        previous = local_vector_index.load(local_index_path)
+    except (OSError, ValueError) as e:
+        print(f"No previous vector index loaded ({e}), embedding all courses")
+        return {}
+
+    return {
+        course_id: (previous.vectors[i], previous.metadata[i] or {})
+        for i, course_id in enumerate(previous.ids)
+    }
+
+
+# Course ids still to be deleted from Pinecone after an earlier run
+def pending_deletes_path(local_index_path):
+    """Path of the file listing course ids still to be deleted from Pinecone."""
+    return f"{local_index_path}.pending_deletes.json"
 
-# Prepare a list of course titles and their corresponding course objects
-course_titles = [course.get('title', '') for course in courses_data]
 
-batch_size = 50  # Smaller batch size for Google API rate limits
+def load_pending_deletes(local_index_path):
+    """
+    Load the course ids an earlier run removed from the local index but not from Pinecone.
 
-# Process in batches
-for i in tqdm(range(0, len(course_titles), batch_size), desc="Processing courses"):
-    batch_titles = course_titles[i:i+batch_size]
-    batch_courses = courses_data[i:i+batch_size]
+    Their delete either failed or was never sent, because the run was local-only
+    (VECTOR_BACKEND=local). Without this list they would never be deleted from Pinecone.
 
-    # Generate embeddings for the batch (only the title)
-    embeddings = generate_batch_embeddings(batch_titles)
+    Args:
+        local_index_path (str): Base path of the local vector index files.
 
-    # Prepare vectors for upsert
-    vectors_to_upsert = []
-    for k in range(len(batch_titles)):
-        course = batch_courses[k]
+    Returns:
+        list: Course ids, empty if there are none.
+    """
+    try:
+        with open(pending_deletes_path(local_index_path), 'r') as f:
+            return list(json.load(f))
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        print(f"Ignoring pending deletes file: {e}")
+        return []
+
+
+def save_pending_deletes(local_index_path, course_ids):
+    """Write the course ids still to be deleted from Pinecone, or remove the file if there are none."""
+    path = pending_deletes_path(local_index_path)
+    if course_ids:
+        with open(path, 'w') as f:
+            json.dump(sorted(course_ids), f)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+# Embed changed courses, upsert them and save the local index
+def build_embeddings(courses_data, embedder, index=None, local_index_path=None, batch_size=50,
+                     concurrency=4, max_retries=4, force=False):
+    """
+    Embed new and changed courses and update the vector indexes.
+
+    Each course's title is hashed with the embedding model. The local index records two hashes
+    per course: content_hash for its stored vector and pinecone_hash for the vector Pinecone
+    holds. Courses whose content_hash matches keep their stored vector; the rest are embedded in
+    batches on a bounded thread pool, and each finished batch is upserted to Pinecone on a second
+    pool while later batches are still being embedded. Stored vectors that Pinecone does not
+    hold yet, for example after a local-only run, are upserted without embedding them again.
+    Courses no longer in the data are deleted; Pinecone deletes that fail, or that a local-only
+    run cannot make, are listed next to the local index and made on the next Pinecone run.
+
+    Args:
+        courses_data (list): Course objects from the course data file.
+        embedder: Object with an embed(texts) method and a model attribute (gemini_embedder or fake_embedder).
+        index (optional): Pinecone index to upsert into. Defaults to None (local index only).
+        local_index_path (str, optional): Base path of the local vector index files. Defaults to None (not saved).
+        batch_size (int, optional): Texts per embedding request, at most 100. Defaults to 50.
+        concurrency (int, optional): Embedding and upsert requests in flight at once. Defaults to 4.
+        max_retries (int, optional): Retries per embedding or upsert request. Defaults to 4.
+        force (bool, optional): Re-embed and re-upsert every course. Defaults to False.
+
+    Returns:
+        dict: Counts of embedded, unchanged, upserted, deleted and failed courses, and of failed or pending deletes.
+    """
+    batch_size = max(1, min(batch_size, max_batch_size))
+
+    # One entry per course id, in catalog order; a later duplicate replaces an earlier one
+    courses = {}
+    for course in courses_data:
         course_id = course.get('courseString')
-        embedding = embeddings[k].tolist()
-        metadata = {
-            'title': course.get('title', ''),
-            'code': course.get('courseString', '')
-        }
-        vectors_to_upsert.append({
-            'id': course_id,
-            'values': embedding,
-            'metadata': metadata
-        })
-
-    # Upsert batch into Pinecone
-    index.upsert(vectors_to_upsert)
-
-print(f"Expected number of titles: {len(course_titles)}")
-# Check index stats
-index_stats = index.describe_index_stats()
-print(f"Total vectors in index '{index_name}': {index_stats['total_vector_count']}") 
\ No newline at end of file
+        if course_id:
+            title = course.get('title', '')
+            courses[course_id] = (title, content_hash(title, embedder.model))
+
+    previous = load_previous_vectors(local_index_path) if local_index_path else {}
+
+    # The hash of the vector Pinecone holds for each course; a local-only run leaves it as it was
+    pinecone_hashes = {course_id: metadata.get('pinecone_hash') for course_id, (_, metadata) in previous.items()}
+
+    vectors = {}
+    to_embed = []
+    to_upsert = []
+    for course_id, (title, digest) in courses.items():
+        if not force and course_id in previous and previous[course_id][1].get('content_hash') == digest:
+            vectors[course_id] = previous[course_id][0]
+            if index is not None and pinecone_hashes.get(course_id) != digest:
+                to_upsert.append(course_id)
+        else:
+            to_embed.append(course_id)
+
+    deleted = [course_id for course_id in previous if course_id not in courses]
+    if local_index_path:
+        deleted += [course_id for course_id in load_pending_deletes(local_index_path)
+                    if course_id not in courses and course_id not in previous]
+
+    print(f"{len(courses)} courses: {len(to_embed)} to embed, {len(to_upsert)} to upsert, "
+          f"{len(courses) - len(to_embed)} unchanged, {len(deleted)} deleted")
+
+    # Courses whose embedding failed get no content hash, and courses whose upsert failed keep
+    # their previous Pinecone hash, so the next run retries them
+    embed_failed = []
+    upsert_failed = []
+    upserted = []
+    delete_failed = []
+    upsert_futures = {}
+    delete_futures = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as embed_pool, \
+         ThreadPoolExecutor(max_workers=concurrency) as upsert_pool:
+
+        batches = {}
+        for start in range(0, len(to_embed), batch_size):
+            batch_ids = to_embed[start:start + batch_size]
+            titles = [courses[course_id][0] for course_id in batch_ids]
+            future = embed_pool.submit(
+                call_with_retry, embedder.embed, titles,
+                max_retries=max_retries, description=f"Embedding batch at {start}"
+            )
+            batches[future] = batch_ids
+
+        def upsert(course_ids):
+            """Queue the vectors of some courses for upserting, in chunks."""
+            for start in range(0, len(course_ids), upsert_batch_size):
+                chunk = [{
+                    'id': course_id,
+                    'values': vectors[course_id].tolist(),
+                    'metadata': {'title': courses[course_id][0], 'code': course_id}
+                } for course_id in course_ids[start:start + upsert_batch_size]]
+                future = upsert_pool.submit(
+                    call_with_retry, index.upsert, chunk, max_retries=max_retries, description="Upsert"
+                )
+                upsert_futures[future] = [vector['id'] for vector in chunk]
+
+        # Stored vectors Pinecone is missing need no embedding request
+        if index is not None:
+            upsert(to_upsert)
+
+        for future in tqdm(as_completed(batches), total=len(batches), desc="Embedding courses"):
+            batch_ids = batches[future]
+            try:
+                embeddings = future.result()
+            except Exception as e:
+                # Left out of the index (or kept at the previous vector) and retried on the next run
+                print(f"Error embedding {len(batch_ids)} courses starting at {batch_ids[0]}: {e}")
+                embed_failed.extend(batch_ids)
+                continue
+
+            for course_id, embedding in zip(batch_ids, embeddings):
+                vectors[course_id] = np.asarray(embedding, dtype=np.float32)
+
+            # Upsert this batch while the next ones are still being embedded
+            if index is not None:
+                upsert(batch_ids)
+
+        if index is not None:
+            for start in range(0, len(deleted), upsert_batch_size):
+                future = upsert_pool.submit(
+                    call_with_retry, lambda ids: index.delete(ids=ids), deleted[start:start + upsert_batch_size],
+                    max_retries=max_retries, description="Delete"
+                )
+                delete_futures[future] = deleted[start:start + upsert_batch_size]
+
+        for future in as_completed(upsert_futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error updating Pinecone: {e}")
+                upsert_failed.extend(upsert_futures[future])
+            else:
+                upserted.extend(upsert_futures[future])
+
+        for future in as_completed(delete_futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error deleting {len(delete_futures[future])} courses from Pinecone: {e}")
+                delete_failed.extend(delete_futures[future])
+
+    # Courses whose embedding failed keep their previous vector, if they had one
+    for course_id in embed_failed:
+        if course_id not in vectors and course_id in previous:
+            vectors[course_id] = previous[course_id][0]
+
+    for course_id in upserted:
+        pinecone_hashes[course_id] = courses[course_id][1]
+
+    # A local-only run leaves every delete to the next Pinecone run
+    pending_deletes = deleted if index is None else delete_failed
+
+    if local_index_path:
+        embed_failed_ids = set(embed_failed)
+        ids = [course_id for course_id in courses if course_id in vectors]
+        metadata = []
+        for course_id in ids:
+            title, digest = courses[course_id]
+            metadata.append({
+                'title': title,
+                'code': course_id,
+                'content_hash': None if course_id in embed_failed_ids else digest,
+                'pinecone_hash': pinecone_hashes.get(course_id)
+            })
+
+        matrix = np.vstack([vectors[course_id] for course_id in ids]) if ids else np.zeros((0, dimension))
+        local_vector_index.save(local_index_path, ids, matrix, metadata)
+        print(f"Saved {len(ids)} vectors to local index '{local_index_path}'")
+
+        save_pending_deletes(local_index_path, pending_deletes)
+
+    return {
+        'embedded': len(to_embed) - len(set(embed_failed)),
+        'unchanged': len(courses) - len(to_embed),
+        'upserted': len(upserted),
+        'deleted': len(deleted) - len(delete_failed),
+        'failed': len(set(embed_failed) | set(upsert_failed)),
+        'delete_failed': len(delete_failed),
+        'delete_pending': len(pending_deletes) if local_index_path else 0
+    }
+
+
+def main():
+    """Embed the course catalog and update the Pinecone and local vector indexes."""
+
+    parser = argparse.ArgumentParser(description="Embed course titles into the vector indexes")
+    parser.add_argument('--courses', default='../data/rutgers_courses.json')
+    parser.add_argument('--batch-size', type=int, default=50, help="Titles per embedding request (max 100)")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv("EMBED_CONCURRENCY", 4)),
+                        help="Embedding and upsert requests in flight at once")
+    parser.add_argument('--max-retries', type=int, default=4)
+    parser.add_argument('--force', action='store_true', help="Re-embed and re-upsert every course")
+    parser.add_argument('--fake', action='store_true', default=os.getenv("EMBEDDER") == "fake",
+                        help="Use deterministic fake embeddings instead of the Gemini API")
+    args = parser.parse_args()
+
+    # 'local' skips Pinecone and only writes the in-process vector index
+    vector_backend = os.getenv("VECTOR_BACKEND", "pinecone")
+    local_index_path = os.getenv("LOCAL_VECTOR_INDEX_PATH", "../data/course_vectors")
+
+    if args.fake:
+        embedder = fake_embedder()
+    else:
+        embedder = gemini_embedder(os.getenv("GOOGLE_API_KEY"))
+
+    index = get_pinecone_index() if vector_backend != "local" else None
+
+    # Load the Rutgers courses data from JSON file
+    with open(args.courses, 'r') as json_file:
+        courses_data = json.load(json_file)
+
+    start = time.perf_counter()
+    counts = build_embeddings(
+        courses_data, embedder, index, local_index_path,
+        batch_size=args.batch_size, concurrency=args.concurrency,
+        max_retries=args.max_retries, force=args.force
+    )
+    print(f"Embedded {counts['embedded']}, unchanged {counts['unchanged']}, upserted {counts['upserted']}, "
+          f"deleted {counts['deleted']}, failed {counts['failed']}, deletes failed {counts['delete_failed']}, "
+          f"deletes pending {counts['delete_pending']} in {time.perf_counter() - start:.1f}s")
+
+    if index is not None:
+        # Check index stats
+        index_stats = index.describe_index_stats()
+        print(f"Total vectors in index '{index_name}': {index_stats['total_vector_count']}")
+
+    # Failed courses and deletes are retried on the next run, but the run itself did not finish the job
+    if counts['failed'] or counts['delete_failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import asyncio
+import math
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+
+# Ratio of driving distance to great-circle distance; a typical road circuity factor for
+# New Jersey. Override with the DETOUR_FACTOR environment variable after comparing with Mapbox.
+DEFAULT_DETOUR_FACTOR = 1.3
+
+
+def haversine_miles(origin, coordinates):
+    """
+    Great-circle distances from one point to many, in a single vectorized call.
+
+    Args:
+        origin (tuple): (latitude, longitude) of the starting point in degrees.
+        coordinates (numpy.ndarray): Array of shape (n, 2) of (latitude, longitude) in degrees.
+
+    Returns:
+        numpy.ndarray: Distances in miles, one per row of coordinates.
+    """
+    lat1, lon1 = np.radians(np.asarray(origin, dtype=np.float64))
+    coordinates = np.radians(np.asarray(coordinates, dtype=np.float64))
+    lat2, lon2 = coordinates[:, 0], coordinates[:, 1]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def estimate_driving_miles(origin, coordinates, detour_factor=DEFAULT_DETOUR_FACTOR):
+    """
+    Approximate driving distances as great-circle distance times a detour factor.
+
+    Args:
+        origin (tuple): (latitude, longitude) of the starting point in degrees.
+        coordinates (numpy.ndarray): Array of shape (n, 2) of (latitude, longitude) in degrees.
+        detour_factor (float, optional): Road distance per straight-line mile. Defaults to DEFAULT_DETOUR_FACTOR.
+
+    Returns:
+        list: Estimated driving distances in miles, rounded to two decimals like the Mapbox results.
+    """
+    return np.round(haversine_miles(origin, coordinates) * detour_factor, 2).tolist()
+
+
+def rank_by_distance(college_distances):
+    """
+    Order a distance table nearest first, so its key order is the colleges' rank order.
+
+    Colleges without a finite distance go last; ties are broken by college name.
+
+    Args:
+        college_distances (dict): College names mapped to distances in miles.
+
+    Returns:
+        dict: The same entries, nearest college first.
+    """
+    def rank(item):
+        college, distance = item
+        unknown = distance is None or math.isinf(distance)
+        return (unknown, 0 if unknown else distance, college)
+
+    return dict(sorted(college_distances.items(), key=rank))
+
+
+class mapbox_matrix_client:
+    """
+    Driving distances from one origin to many destinations in a single Mapbox Matrix request.
+
+    Requests go through one long-lived aiohttp session with a pooled connector, so repeated
+    lookups reuse TCP/TLS connections. Each request has a timeout and bounded retries, and a
+    semaphore limits how many requests are in flight at once.
+
+    Attributes:
+        access_token (str): Mapbox access token
+        timeout (float): Total seconds allowed per request attempt
+        max_retries (int): Retries after the first attempt for timeouts, 429s and 5xx responses
+        max_concurrency (int): Maximum number of requests in flight
+    """
+
+    base_url = "https://api.mapbox.com/directions-matrix/v1/mapbox/driving"
+
+    # The driving profile accepts at most 25 coordinates per request
+    max_coordinates = 25
+
+    def __init__(self, access_token, timeout=10, max_retries=2, max_concurrency=4):
+        """
+        Initialize the client. The HTTP session is created on first use inside the event loop.
+
+        Args:
+            access_token (str): Mapbox access token.
+            timeout (float, optional): Total seconds allowed per request attempt. Defaults to 10.
+            max_retries (int, optional): Retries after the first attempt. Defaults to 2.
+            max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 4.
+        """
+        self.access_token = access_token
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.session = None
+        self.semaphore = None
+        self.loop = None
+
+    def _get_session(self):
+        # aiohttp is only imported once Mapbox is actually used
+        import aiohttp
+
+        # Sessions are bound to the event loop they were created in
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self.session
+
+    async def driving_miles(self, origin, destinations):
+        """
+        Get driving distances from an origin to each destination.
+
+        Args:
+            origin (tuple): (latitude, longitude) of the starting point.
+            destinations (list): (latitude, longitude) tuples of the destinations.
+
+        Returns:
+            list: Driving distances in miles rounded to two decimals, None where Mapbox found no route.
+        """
+        distances = []
+        batch_size = self.max_coordinates - 1
+
+        for start in range(0, len(destinations), batch_size):
+            batch = destinations[start:start + batch_size]
+
+            # Coordinates as Longitude, Latitude format, origin first
+            coordinates = ';'.join(f"{lon},{lat}" for lat, lon in [origin, *batch])
+            url = f"{self.base_url}/{coordinates}"
+            params = {
+                'sources': '0',
+                'destinations': ';'.join(str(i) for i in range(1, len(batch) + 1)),
+                'annotations': 'distance',
+                'access_token': self.access_token
+            }
+
+            data = await self._request(url, params)
+
+            for distance_in_meters in data['distances'][0]:
+                # Convert meters to miles (1 mile = 1609.34 meters)
+                distances.append(None if distance_in_meters is None else round(distance_in_meters / 1609.34, 2))
+
+        return distances
+
+    async def _request(self, url, params):
+        """GET a Matrix URL, retrying timeouts, rate limits and server errors with backoff."""
+        import aiohttp
+
+        session = self._get_session()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    async with session.get(url, params=params) as response:
+                        if response.status == 429 or response.status >= 500:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history,
+                                status=response.status, message=response.reason
+                            )
+                        response.raise_for_status()
+                        data = await response.json()
+
+                if data.get('code') != 'Ok':
+                    raise ValueError(f"Mapbox Matrix error: {data.get('code')} {data.get('message', '')}")
+                return data
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status == 429 or e.status >= 500
+                if attempt == self.max_retries or not retryable:
+                    raise
+                await asyncio.sleep(0.25 * 2 ** attempt)
+
+    async def close(self):
+        """Close the pooled HTTP session."""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
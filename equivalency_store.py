@@ -0,0 +1,325 @@
+import functools
+import os
+
+import numpy as np
+
+# Bump when the stored arrays change so old stores are rebuilt from the CSV
+STORE_VERSION = 2
+
+# Columns of the equivalency CSV, in file order
+FIELDNAMES = ['community_college', 'college', 'code', 'name', 'credits', 'equivalency', 'transfer_credit']
+
+# Text columns with few distinct values, stored as integer codes into a category array;
+# every column is, so rows read back exactly as the CSV's text
+CATEGORICAL = tuple(FIELDNAMES)
+
+# Courses whose decoded rows are kept by equivalency_table.college_rows
+ROW_CACHE_SIZE = 8192
+
+
+def normalize_course_code(code):
+    """Key used to match Rutgers course codes: colons and whitespace removed, e.g. '01:198:111' -> '01198111'.
+
+    Args:
+        code (str): A course code in any of the usual forms.
+
+    Returns:
+        str: The normalized code, '' for a missing code.
+    """
+    return ''.join((code or '').split()).replace(':', '')
+
+
+def normalize_college_code(code):
+    """Key used to match community college course codes: whitespace removed and uppercased, e.g. 'bio 101' -> 'BIO101'.
+
+    Args:
+        code (str): A community college course code.
+
+    Returns:
+        str: The normalized code, '' for a missing code.
+    """
+    return ''.join((code or '').split()).upper()
+
+
+class equivalency_table:
+    """
+    Community college equivalencies stored as typed NumPy columns, sorted by Rutgers course code.
+
+    Every column is categorical text: each row holds a small integer code into an array of the
+    column's distinct values, so rows read back exactly as the CSV's text. Rows are sorted
+    stably by the normalized Rutgers course code, so a lookup is a binary search that returns a
+    contiguous block of rows still in file order.
+
+    On disk a table is a single .npz file of these arrays, loaded without parsing any text.
+
+    Attributes:
+        keys (numpy.ndarray): Normalized Rutgers course codes as ASCII bytes, sorted
+        columns (dict): Column name mapped to its array of category codes
+        categories (dict): Categorical column name mapped to its array of distinct values
+        source (tuple): (mtime_ns, size) of the CSV the table was built from
+    """
+
+    def __init__(self, keys, columns, categories, source=None):
+        """
+        Initialize the table from already sorted columns.
+
+        Args:
+            keys (numpy.ndarray): Sorted normalized course codes.
+            columns (dict): Arrays aligned with keys.
+            categories (dict): Distinct values of each categorical column.
+            source (tuple, optional): (mtime_ns, size) of the source CSV.
+        """
+        self.keys = keys
+        self.columns = columns
+        self.categories = categories
+        self.source = source
+
+        # Decoding rows costs more than the binary search, so recently used courses keep theirs
+        self.college_rows = functools.lru_cache(maxsize=ROW_CACHE_SIZE)(self._college_rows)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def file_signature(path):
+        """Return (mtime_ns, size) of a file, or None if it does not exist."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def empty(cls):
+        """A table without rows."""
+        return cls(
+            np.array([], dtype='S1'),
+            {name: np.array([], dtype=np.int16) for name in CATEGORICAL},
+            {name: np.array([], dtype=str) for name in CATEGORICAL}
+        )
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        """
+        Build the table from the equivalency CSV with pandas' C parser.
+
+        Rows without a Rutgers course code or a community college are dropped.
+
+        Args:
+            csv_path (str): Path to the equivalency CSV file.
+
+        Returns:
+            equivalency_table: The built table.
+        """
+        # pandas is only needed to build a table, not to load a stored one
+        import pandas as pd
+
+        source = cls.file_signature(csv_path)
+        frame = pd.read_csv(csv_path, dtype=str, keep_default_na=False, usecols=lambda name: name in FIELDNAMES)
+        for name in FIELDNAMES:
+            if name not in frame:
+                frame[name] = ''
+
+        keys = frame['equivalency'].str.replace(r'[\s:]', '', regex=True)
+        frame = frame[(keys != '') & (frame['community_college'] != '')]
+        keys = np.char.encode(keys[frame.index].to_numpy(dtype=str), 'ascii', 'replace')
+
+        # Stable, so rows for the same course keep their file order
+        order = np.argsort(keys, kind='stable')
+
+        columns = {}
+        categories = {}
+        for name in CATEGORICAL:
+            values = frame[name].astype('category')
+            columns[name] = values.cat.codes.to_numpy()[order]
+            categories[name] = values.cat.categories.to_numpy(dtype=str)
+
+        return cls(keys[order], columns, categories, source)
+
+    def save(self, store_path):
+        """
+        Write the table to a .npz store, through a temporary file renamed into place.
+
+        Args:
+            store_path (str): Path of the store.
+        """
+        arrays = {'version': np.array(STORE_VERSION), 'keys': self.keys,
+                  'source': np.array(self.source if self.source else (-1, -1), dtype=np.int64)}
+        for name, values in self.columns.items():
+            arrays[f"column_{name}"] = values
+        for name, values in self.categories.items():
+            arrays[f"categories_{name}"] = values
+
+        temp_path = f"{store_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, store_path)
+
+    @classmethod
+    def load_store(cls, store_path):
+        """
+        Load a table written by save.
+
+        Args:
+            store_path (str): Path of the store.
+
+        Returns:
+            equivalency_table: The loaded table, or None if the store is missing, outdated or unreadable.
+        """
+        try:
+            with np.load(store_path, allow_pickle=False) as arrays:
+                if int(arrays['version']) != STORE_VERSION:
+                    return None
+                source = tuple(int(value) for value in arrays['source'])
+                columns = {name: arrays[f"column_{name}"] for name in CATEGORICAL}
+                categories = {name: arrays[f"categories_{name}"] for name in CATEGORICAL}
+                return cls(arrays['keys'], columns, categories, None if source == (-1, -1) else source)
+        except (OSError, KeyError, ValueError) as e:
+            if os.path.exists(store_path):
+                print(f"Ignoring equivalency store {store_path}: {e}")
+            return None
+
+    @classmethod
+    def load(cls, csv_path, store_path=None):
+        """
+        Load the table, from the store when it was built from the current CSV.
+
+        A stale or missing store is rebuilt from the CSV and written back.
+
+        Args:
+            csv_path (str): Path to the equivalency CSV file.
+            store_path (str, optional): Path of the .npz store. Defaults to None (always parse the CSV).
+
+        Returns:
+            equivalency_table: The loaded table, empty if neither file exists.
+        """
+        source = cls.file_signature(csv_path)
+
+        if store_path:
+            table = cls.load_store(store_path)
+            if table is not None and (source is None or table.source == source):
+                return table
+
+        if source is None:
+            print(f"Equivalency file not found: {csv_path}")
+            return cls.empty()
+
+        table = cls.from_csv(csv_path)
+        if store_path:
+            try:
+                table.save(store_path)
+            except OSError as e:
+                print(f"Could not write equivalency store {store_path}: {e}")
+        return table
+
+    def find(self, course_code):
+        """
+        Find the rows for a Rutgers course with a binary search.
+
+        Args:
+            course_code (str): Rutgers course code, with or without colons.
+
+        Returns:
+            slice: The block of rows for the course, in file order (empty if there are none).
+        """
+        key = normalize_course_code(course_code).encode('ascii', 'replace')
+        return slice(int(np.searchsorted(self.keys, key, 'left')), int(np.searchsorted(self.keys, key, 'right')))
+
+    def first_per_college(self, course_code):
+        """
+        Pick the first row for each community college offering an equivalent of a course.
+
+        Args:
+            course_code (str): Rutgers course code, with or without colons.
+
+        Returns:
+            numpy.ndarray: Row numbers, ordered by community college name.
+        """
+        rows = self.find(course_code)
+        _, first = np.unique(self.columns['community_college'][rows], return_index=True)
+        return rows.start + first
+
+    @functools.cached_property
+    def reverse_index(self):
+        """
+        Index from (community college, community college course code) to rows, built on first use.
+
+        Every row gets an integer key combining its community college and normalized course
+        code, and the rows are sorted stably by that key. The dictionary maps each key to its
+        block of the sorted order, so a lookup is two dictionary reads and a slice.
+
+        Returns:
+            tuple: (college ids by lowercased name, code groups by normalized code,
+                number of code groups, {key: (start, end)}, row numbers sorted by key).
+        """
+        normalized = [normalize_college_code(code) for code in self.categories['code']]
+        group_codes, code_groups = np.unique(np.array(normalized, dtype=str), return_inverse=True)
+
+        keys = self.columns['community_college'].astype(np.int64) * len(group_codes) + code_groups[self.columns['code']]
+        order = np.argsort(keys, kind='stable')
+        unique_keys, starts = np.unique(keys[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+
+        college_ids = {str(name).lower(): i for i, name in enumerate(self.categories['community_college'])}
+        group_ids = {str(code): i for i, code in enumerate(group_codes)}
+        blocks = dict(zip(unique_keys.tolist(), zip(starts.tolist(), ends.tolist())))
+        return college_ids, group_ids, len(group_codes), blocks, order
+
+    def build_reverse_index(self):
+        """Build the reverse index now rather than on the first find_reverse call."""
+        return self.reverse_index
+
+    def find_reverse(self, community_college, code):
+        """
+        Find the rows for a community college course in constant time.
+
+        Args:
+            community_college (str): Community college name, in any letter case.
+            code (str): Community college course code, e.g. 'BIO 101'.
+
+        Returns:
+            numpy.ndarray: Row numbers, ordered by Rutgers course code, or None if the community college is unknown.
+        """
+        college_ids, group_ids, group_count, blocks, order = self.reverse_index
+
+        college = college_ids.get((community_college or '').strip().lower())
+        if college is None:
+            return None
+
+        group = group_ids.get(normalize_college_code(code))
+        if group is None:
+            return order[:0]
+
+        start, end = blocks.get(college * group_count + group, (0, 0))
+        return order[start:end]
+
+    def _college_rows(self, course_code):
+        """
+        Get the first row for each community college offering an equivalent of a course.
+
+        Cached per course code as college_rows(); the returned rows are shared, so copy before changing them.
+
+        Args:
+            course_code (str): Rutgers course code, with or without colons.
+
+        Returns:
+            dict: Community college name mapped to its row dictionary, in community college name order.
+        """
+        return {row['community_college']: row for row in map(self.row, self.first_per_college(course_code))}
+
+    def value(self, name, row):
+        """Read one cell as the CSV's text, with empty text as None."""
+        value = str(self.categories[name][self.columns[name][row]])
+        return value if value != '' else None
+
+    def row(self, row):
+        """
+        Read a row as a dictionary in the CSV's column order.
+
+        Args:
+            row (int): Row number.
+
+        Returns:
+            dict: The row, with empty cells as None so they serialize to null in JSON.
+        """
+        return {name: self.value(name, row) for name in FIELDNAMES}
@@ -1,4 +1,40 @@
+import gc
+import os
+import secrets
+import sys
+
 bind = "0.0.0.0:8080"
-workers = 2
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
 worker_class = "uvicorn.workers.UvicornWorker"
-module = "app:app"
\ No newline at end of file
+module = "app:app"
+
+# Load the app (catalog, lookup indexes, local vector index) once in the master and fork the
+# workers from it, so they share that memory copy-on-write instead of each building a copy.
+# Set PRELOAD_APP=0 to load the app separately in every worker.
+preload_app = os.getenv("PRELOAD_APP", "1") != "0"
+
+if preload_app:
+    # Collections while the app loads would free and reuse pages the workers later copy
+    gc.disable()
+
+# Share cached embeddings and distances between workers
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite")
+os.environ.setdefault("DISTANCE_CACHE_PATH", "data/distance_cache.sqlite")
+
+# Every worker must sign and check session tokens with the same key, even without preloading
+os.environ.setdefault("SESSION_SECRET", secrets.token_hex(32))
+
+
+def when_ready(server):
+    """Runs in the master after the app is preloaded, just before the workers are forked."""
+    if not preload_app:
+        return
+
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.courses_controller.preload()
+
+    # Move everything loaded so far to the permanent generation, so the garbage collector in
+    # the workers never touches (and copies) the shared pages
+    gc.freeze()
+    gc.enable()
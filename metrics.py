@@ -0,0 +1,239 @@
+import asyncio
+import bisect
+import threading
+import time
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'rucoursefinder'
+
+# Histogram bucket upper bounds in seconds: from the microsecond in-memory joins to the multi-second upstream calls
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value):
+    """Format a sample value the way the Prometheus text format expects."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(labels):
+    """Format a label dictionary as {name="value",...}, escaping values."""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class histogram:
+    """
+    Fixed-bucket latency histogram.
+
+    Observations only increment one bucket counter, so recording is a binary search and a few
+    additions; the cumulative bucket counts Prometheus expects are built when the metrics are read.
+    It takes no lock: the search stages are all timed on the event loop thread.
+
+    Attributes:
+        buckets (tuple): Bucket upper bounds in seconds, ascending
+        counts (list): Observations per bucket, with a final bucket for values above the last bound
+        total (float): Sum of all observed values
+        count (int): Number of observations
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize an empty histogram.
+
+        Args:
+            buckets (tuple, optional): Bucket upper bounds in seconds. Defaults to DEFAULT_BUCKETS.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Record one observation.
+
+        Args:
+            value (float): Observed value in seconds.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self):
+        """
+        Read the histogram.
+
+        Returns:
+            tuple: (cumulative counts per bucket bound, sum, count).
+        """
+        counts = list(self.counts)
+        total, count = self.total, self.count
+
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        cumulative.append((float('inf'), count))
+        return cumulative, total, count
+
+
+class stage_timer:
+    """Context manager that records the time spent in a stage, and an error if the stage raises."""
+
+    __slots__ = ('registry', 'stage', 'histogram', 'start')
+
+    def __init__(self, registry, stage, stage_histogram):
+        self.registry = registry
+        self.stage = stage
+        self.histogram = stage_histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.registry.count_error(self.stage, exc)
+        return False
+
+
+class metrics_registry:
+    """
+    In-process metrics for the search hot path, exported in the Prometheus text format.
+
+    Keeps a latency histogram per stage (embedding, vector query, equivalency join, ...) and a
+    counter of errors per stage and kind. Cache statistics are not copied here: the caches keep
+    their own hit and miss counters, which are read when the metrics are rendered.
+
+    Each process has its own registry, so with several gunicorn workers every worker reports
+    its own numbers.
+
+    Attributes:
+        buckets (tuple): Bucket upper bounds used for new histograms
+        stages (dict): Stage name mapped to its histogram
+        errors (dict): (stage, kind) mapped to an error count
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize an empty registry.
+
+        Args:
+            buckets (tuple, optional): Histogram bucket upper bounds in seconds. Defaults to DEFAULT_BUCKETS.
+        """
+        self.buckets = tuple(buckets)
+        self.stages = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def time(self, stage):
+        """
+        Time a block of code as one observation of a stage.
+
+        Usage: ``with metrics.time('embed'): ...``. An exception leaving the block is also
+        counted as an error of the stage.
+
+        Args:
+            stage (str): Stage name.
+
+        Returns:
+            stage_timer: The context manager.
+        """
+        return stage_timer(self, stage, self.stage_histogram(stage))
+
+    def stage_histogram(self, stage):
+        """Get the histogram of a stage, creating it on first use."""
+        stage_histogram = self.stages.get(stage)
+        if stage_histogram is None:
+            with self.lock:
+                stage_histogram = self.stages.setdefault(stage, histogram(self.buckets))
+        return stage_histogram
+
+    def observe(self, stage, seconds):
+        """
+        Record the duration of one run of a stage.
+
+        Args:
+            stage (str): Stage name.
+            seconds (float): Duration in seconds.
+        """
+        self.stage_histogram(stage).observe(seconds)
+
+    def count_error(self, stage, error=None):
+        """
+        Count an error of a stage, such as a failed upstream call.
+
+        Args:
+            stage (str): Stage name.
+            error (BaseException, optional): The error; timeouts are counted as kind 'timeout',
+                everything else as 'error'. Defaults to None.
+        """
+        kind = 'timeout' if isinstance(error, (asyncio.TimeoutError, TimeoutError)) else 'error'
+        with self.lock:
+            self.errors[(stage, kind)] = self.errors.get((stage, kind), 0) + 1
+
+    def render(self, caches=None, gauges=None):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Args:
+            caches (dict, optional): Cache name mapped to its stats() dictionary (size, hits, misses, hit_ratio).
+            gauges (dict, optional): Extra gauge name mapped to (help text, value).
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+
+        def sample(name, labels, value):
+            lines.append(f'{METRIC_PREFIX}_{name}{format_labels(labels)} {format_value(value)}')
+
+        family('stage_duration_seconds', 'histogram', 'Time spent in each search stage.')
+        for stage, stage_histogram in sorted(self.stages.items()):
+            cumulative, total, count = stage_histogram.snapshot()
+            for bound, bucket_count in cumulative:
+                sample('stage_duration_seconds_bucket', {'stage': stage, 'le': format_value(bound)}, bucket_count)
+            sample('stage_duration_seconds_sum', {'stage': stage}, total)
+            sample('stage_duration_seconds_count', {'stage': stage}, count)
+
+        family('errors_total', 'counter', 'Errors per stage, including failed upstream calls.')
+        with self.lock:
+            errors = sorted(self.errors.items())
+        for (stage, kind), count in errors:
+            sample('errors_total', {'stage': stage, 'kind': kind}, count)
+
+        if caches:
+            family('cache_hits_total', 'counter', 'Cache lookups answered from the cache.')
+            for name, stats in caches.items():
+                sample('cache_hits_total', {'cache': name}, stats.get('hits', 0))
+            family('cache_misses_total', 'counter', 'Cache lookups that had to be computed.')
+            for name, stats in caches.items():
+                sample('cache_misses_total', {'cache': name}, stats.get('misses', 0))
+            family('cache_hit_ratio', 'gauge', 'Share of cache lookups answered from the cache.')
+            for name, stats in caches.items():
+                sample('cache_hit_ratio', {'cache': name}, stats.get('hit_ratio', 0.0))
+            family('cache_entries', 'gauge', 'Entries held in memory by each cache.')
+            for name, stats in caches.items():
+                sample('cache_entries', {'cache': name}, stats.get('size', 0))
+
+        for name, (help_text, value) in (gauges or {}).items():
+            family(name, 'gauge', help_text)
+            sample(name, None, value)
+
+        return '\n'.join(lines) + '\n'
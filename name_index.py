@@ -0,0 +1,131 @@
+import difflib
+import heapq
+from collections import Counter
+
+
+class ngram_index:
+    """
+    Inverted index of character n-grams over a list of names.
+
+    Answers substring queries by intersecting the postings of the query's n-grams, and fuzzy
+    "did you mean" queries by scoring only names that share n-grams with the query.
+
+    Attributes:
+        names (list): Indexed names, in their original form and order
+        normalized (list): Lowercased names, aligned with names
+        n (int): Length of the n-grams intersected for substring matching
+        fuzzy_n (int): Length of the n-grams used to find fuzzy candidates
+        postings (dict): Mapping of every 1..n character gram to the set of name ids containing it
+    """
+
+    def __init__(self, names, n=3, fuzzy_n=2):
+        """
+        Build the index.
+
+        Args:
+            names (iterable): Names to index.
+            n (int, optional): Longest n-gram to index. Defaults to 3.
+            fuzzy_n (int, optional): N-gram length for fuzzy candidates; shorter grams tolerate
+                typos in short names better. Defaults to 2.
+        """
+        self.names = list(names)
+        self.normalized = [self.normalize(name) for name in self.names]
+        self.n = n
+        self.fuzzy_n = min(fuzzy_n, n)
+        self.postings = {}
+        self.gram_counts = []
+
+        for name_id, name in enumerate(self.normalized):
+            for gram in self._grams(name, 1, n):
+                self.postings.setdefault(gram, set()).add(name_id)
+            self.gram_counts.append(len(self._grams(name, self.fuzzy_n, self.fuzzy_n)))
+
+    @staticmethod
+    def normalize(name):
+        """
+        Normalize a name for matching.
+
+        Args:
+            name (str): The name.
+
+        Returns:
+            str: Lowercased name with surrounding whitespace removed.
+        """
+        return (name or '').lower().strip()
+
+    @staticmethod
+    def _grams(text, shortest, longest):
+        grams = set()
+        for size in range(shortest, longest + 1):
+            for i in range(len(text) - size + 1):
+                grams.add(text[i:i + size])
+        return grams
+
+    def search(self, term):
+        """
+        Find names containing a search term.
+
+        Args:
+            term (str): The substring to look for.
+
+        Returns:
+            list: Matching names, in index order.
+        """
+        term = self.normalize(term)
+        if not term:
+            return []
+
+        if len(term) <= self.n:
+            candidates = self.postings.get(term, set())
+        else:
+            # Intersect the rarest postings first, then verify the full substring
+            postings = sorted((self.postings.get(gram, set()) for gram in self._grams(term, self.n, self.n)), key=len)
+            candidates = set.intersection(*postings) if postings else set()
+            candidates = {i for i in candidates if term in self.normalized[i]}
+
+        return [self.names[i] for i in sorted(candidates)]
+
+    def similar(self, term, limit=5, cutoff=0.7, max_candidates=50):
+        """
+        Find names similar to a search term.
+
+        Candidates are the names sharing the most n-grams with the term (by Dice coefficient);
+        only those are compared with difflib against the full name, each comma-separated part and,
+        for "last, first" names, the "first last" form.
+
+        Args:
+            term (str): The name to find similarities for.
+            limit (int, optional): Maximum number of names to return. Defaults to 5.
+            cutoff (float, optional): Minimum difflib similarity (0.0 to 1.0). Defaults to 0.7.
+            max_candidates (int, optional): Number of n-gram candidates to rerank. Defaults to 50.
+
+        Returns:
+            list: Similar names, most similar first.
+        """
+        term = self.normalize(term)
+        query_grams = self._grams(term, self.fuzzy_n, self.fuzzy_n)
+        if not query_grams:
+            return []
+
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self.postings.get(gram, ()))
+
+        candidates = heapq.nlargest(
+            max_candidates,
+            overlap,
+            key=lambda i: 2 * overlap[i] / (len(query_grams) + self.gram_counts[i])
+        )
+
+        scored = []
+        for name_id in candidates:
+            name = self.normalized[name_id]
+            parts = [part.strip() for part in name.split(',')]
+            forms = [name] + parts
+            if len(parts) == 2:
+                forms.append(f"{parts[1]} {parts[0]}")
+            score = max(difflib.SequenceMatcher(None, term, form).ratio() for form in forms)
+            if score >= cutoff:
+                scored.append((score, name_id))
+
+        return [self.names[i] for _, i in heapq.nlargest(limit, scored)]
@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import csv
+import gc
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+# Allow running as `python scripts/benchmark_search.py` from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import course_catalog
+from controller import course_search
+from equivalency_store import equivalency_table
+
+
+def legacy_equivalencies(course_code, college_distances, equivalencies_path):
+    """Per-call pandas implementation the controller used before the equivalency index."""
+
+    equivalencies = pd.read_csv(equivalencies_path)
+    equivalencies = equivalencies[equivalencies['equivalency'] == course_code]
+
+    if equivalencies.empty:
+        return []
+
+    equivalencies['Distance'] = [college_distances.get(college) for college in equivalencies['community_college']]
+
+    unique_colleges = set()
+    top_5 = []
+    for _, row in equivalencies.sort_values('Distance').iterrows():
+        college = row['community_college']
+        if college not in unique_colleges:
+            unique_colleges.add(college)
+            top_5.append(row.to_dict())
+            if len(top_5) == 5:
+                break
+    return top_5
+
+
+def legacy_equivalency_index(equivalencies_path):
+    """Dictionary index of CSV rows the controller built before the columnar equivalency table."""
+
+    equivalencies_by_code = {}
+    with open(equivalencies_path, 'r', newline='', encoding='utf-8') as csv_file:
+        for row in csv.DictReader(csv_file):
+            course_code = (row.get('equivalency') or '').strip()
+            college = row.get('community_college')
+            if not course_code or not college:
+                continue
+            row = {key: (value if value != '' else None) for key, value in row.items()}
+            equivalencies_by_code.setdefault(course_code, {}).setdefault(college, []).append(row)
+    return equivalencies_by_code
+
+
+def summarize(label, samples):
+    """Print mean, p50 and p95 latency in milliseconds."""
+
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<12} mean={statistics.mean(samples):9.3f}ms  p50={statistics.median(samples):9.3f}ms  p95={p95:9.3f}ms")
+
+
+def bench_equivalencies(controller, args):
+    """Time the equivalency join for every course a /search_by_code request would return."""
+
+    codes = [code for code in controller.courses_by_code if code.endswith(args.code)]
+
+    # Fake distances, nearest first like get_all_college_distances returns them, so both implementations sort by distance
+    college_distances = {college: float(i) for i, college in enumerate(controller.community_colleges)}
+
+    print(f"{len(codes)} courses match '{args.code}', {args.iterations} iterations")
+
+    before = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        for code in codes:
+            legacy_equivalencies(code, college_distances, args.equivalencies)
+        before.append((time.perf_counter() - start) * 1000)
+
+    async def run_indexed():
+        samples = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            for code in codes:
+                await controller.get_top_5_course_equivalencies_by_distance(code, college_distances)
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
+
+    after = asyncio.run(run_indexed())
+
+    summarize('before', before)
+    summarize('after', after)
+
+
+def bench_startup(controller, args):
+    """Time loading the catalog from JSON against loading the prebuilt snapshot."""
+
+    snapshot_path = controller.catalog_snapshot_path or 'data/rutgers_courses.snapshot.pkl'
+    course_catalog.from_json(args.courses).save_snapshot(snapshot_path)
+
+    print(f"{len(controller.courses)} courses, {args.iterations} iterations")
+
+    before = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        course_catalog.load(args.courses, None)
+        before.append((time.perf_counter() - start) * 1000)
+
+    after = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        course_catalog.load(args.courses, snapshot_path)
+        after.append((time.perf_counter() - start) * 1000)
+
+    summarize('json', before)
+    summarize('snapshot', after)
+
+
+def resident_mb():
+    """Resident set size of this process in MB (Linux only)."""
+
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def measure_retained(load, results):
+    """Put the resident memory still held after load() into results (run in a fresh child process)."""
+
+    gc.collect()
+    before = resident_mb()
+    data = load()
+    gc.collect()
+    results.put(resident_mb() - before)
+
+
+def bench_memory(args):
+    """Report resident memory held by the raw course JSON and by the catalog, each in its own process."""
+
+    snapshot_path = os.path.join(tempfile.mkdtemp(), 'catalog.snapshot.pkl')
+    course_catalog.build_snapshot(args.courses, snapshot_path)
+
+    loaders = [
+        ('raw json', lambda: json.load(open(args.courses))),
+        ('catalog from json', lambda: course_catalog.from_json(args.courses)),
+        ('catalog from snapshot', lambda: course_catalog.load(args.courses, snapshot_path)),
+    ]
+
+    context = multiprocessing.get_context('fork')
+    for label, load in loaders:
+        results = context.Queue()
+        process = context.Process(target=measure_retained, args=(load, results))
+        process.start()
+        retained = results.get()
+        process.join()
+        print(f"{label:<22} {retained:8.1f} MB resident")
+
+    os.remove(snapshot_path)
+    os.rmdir(os.path.dirname(snapshot_path))
+
+
+def bench_equivalency_load(args):
+    """Time and measure loading the equivalency CSV as dictionaries, as a columnar table and from its store."""
+
+    store_path = os.path.join(tempfile.mkdtemp(), 'equivalencies.npz')
+    equivalency_table.from_csv(args.equivalencies).save(store_path)
+
+    loaders = [
+        ('dict', lambda: legacy_equivalency_index(args.equivalencies)),
+        ('csv table', lambda: equivalency_table.from_csv(args.equivalencies)),
+        ('store', lambda: equivalency_table.load_store(store_path)),
+    ]
+
+    print(f"{len(equivalency_table.load_store(store_path))} equivalencies, {args.iterations} iterations")
+
+    context = multiprocessing.get_context('fork')
+    for label, load in loaders:
+        samples = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            load()
+            samples.append((time.perf_counter() - start) * 1000)
+        summarize(label, samples)
+
+        results = context.Queue()
+        process = context.Process(target=measure_retained, args=(load, results))
+        process.start()
+        print(f"{'':<12} {results.get():.1f} MB resident")
+        process.join()
+
+    os.remove(store_path)
+    os.rmdir(os.path.dirname(store_path))
+
+
+def main():
+    """Run the selected benchmark against the local data files."""
+
+    parser = argparse.ArgumentParser(description="Benchmark course search hot paths")
+    parser.add_argument('benchmark', choices=['equivalencies', 'equivalency-load', 'startup', 'memory'])
+    parser.add_argument('--courses', default='data/rutgers_courses.json')
+    parser.add_argument('--equivalencies', default='data/community_to_college.csv')
+    parser.add_argument('--code', default='101', help="Course code suffix to search for")
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.benchmark == 'memory':
+        bench_memory(args)
+        return
+    if args.benchmark == 'equivalency-load':
+        bench_equivalency_load(args)
+        return
+
+    controller = course_search(courses_data_path=args.courses, equivalencies_path=args.equivalencies)
+
+    if args.benchmark == 'equivalencies':
+        bench_equivalencies(controller, args)
+    elif args.benchmark == 'startup':
+        bench_startup(controller, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import argparse
+import os
+import sys
+import time
+
+# Allow running as `python scripts/build_catalog_snapshot.py` from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import course_catalog
+
+
+def main():
+    """Build the course catalog from JSON and write it as a snapshot the app loads at startup."""
+
+    parser = argparse.ArgumentParser(description="Build the precompiled course catalog snapshot")
+    parser.add_argument('--courses', default='data/rutgers_courses.json')
+    parser.add_argument('--output', default='data/rutgers_courses.snapshot.pkl')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalog = course_catalog.from_json(args.courses)
+    catalog.save_snapshot(args.output)
+
+    print(f"Saved catalog snapshot of {len(catalog.courses)} courses to {args.output} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
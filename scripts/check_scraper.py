@@ -0,0 +1,123 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from njtransfer_standin import PAGE_PATH, make_server
+from scrape_course_equivalencies import (browser_scraper, csv_writer, fixture_name, http_scraper,
+                                         parse_courses, scrape)
+
+# Pairs with a saved results page, and pairs the stand-in answers with an empty table
+PAIRS = [
+    ('Bergen Community College', 'Rutgers-School of Arts and Sciences'),
+    ('Bergen Community College', 'Rutgers-School of Engineering'),
+    ('Camden County College', 'Rutgers-School of Arts and Sciences'),
+    ('Camden County College', 'Rutgers-School of Nursing'),
+    ('Middlesex College', 'Rutgers-School of Arts and Sciences'),
+    ('Middlesex College', 'Rutgers-School of Engineering'),
+]
+
+# Pairs that fail in the interrupted run
+FAIL_PAIRS = {
+    ('Camden County College', 'Rutgers-School of Arts and Sciences'),
+    ('Middlesex College', 'Rutgers-School of Engineering'),
+}
+
+
+def expected_csv(fixtures_dir, pairs):
+    """The CSV a complete scrape should produce: every saved page parsed directly, in pair order."""
+    buffer = io.StringIO()
+    writer = csv_writer(buffer)
+    writer.writeheader()
+    for pair in pairs:
+        path = os.path.join(fixtures_dir, fixture_name(*pair))
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                writer.writerows(parse_courses(f.read(), *pair))
+    return buffer.getvalue()
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def check(condition, description, failures):
+    """Print one check result and remember failures."""
+    print(f"{'ok  ' if condition else 'FAIL'} {description}")
+    if not condition:
+        failures.append(description)
+
+
+def main():
+    """Check a full scrape, and an interrupted one resumed, against the stand-in serving the saved pages."""
+
+    parser = argparse.ArgumentParser(description="Check the scraper against saved NJTransfer pages")
+    parser.add_argument('--mode', choices=('http', 'browser'), default='http')
+    args = parser.parse_args()
+
+    server = make_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state = server.state
+    base_url = f"http://127.0.0.1:{server.server_address[1]}{PAGE_PATH}"
+
+    def new_scraper():
+        if args.mode == 'http':
+            return http_scraper(base_url, timeout=10, max_retries=0)
+        return browser_scraper(base_url)
+
+    def run(output_path):
+        scraper = new_scraper()
+        try:
+            return scrape(scraper, output_path, PAIRS, workers=3)
+        finally:
+            scraper.close()
+
+    failures = []
+    expected = expected_csv(state.fixtures_dir, PAIRS)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            full_path = os.path.join(tmp, 'full.csv')
+            failed = run(full_path)
+            check(not failed and os.path.exists(full_path) and read(full_path) == expected,
+                  "a full scrape matches the saved pages, in pair order", failures)
+
+            # The interrupted run: some pairs fail, and the last writes were cut off
+            output_path = os.path.join(tmp, 'resumed.csv')
+            state.fail_pairs = set(FAIL_PAIRS)
+            failed = run(output_path)
+            check(set(failed) == FAIL_PAIRS and not os.path.exists(output_path)
+                  and os.path.exists(f"{output_path}.checkpoint"),
+                  "failed pairs leave a checkpoint and no output", failures)
+
+            with open(f"{output_path}.partial", 'a', encoding='utf-8') as f:
+                f.write('Camden County College,Rutgers-School of Arts and Sciences,CSC 2')
+            with open(f"{output_path}.checkpoint", 'a', encoding='utf-8') as f:
+                f.write('{"community_college": "Camden County Coll')
+
+            state.fail_pairs = set()
+            state.searched.clear()
+            failed = run(output_path)
+            check(not failed and set(state.searched) == FAIL_PAIRS,
+                  "the resumed run requests only the unfinished pairs", failures)
+            check(os.path.exists(output_path) and read(output_path) == expected == read(full_path),
+                  "the resumed output matches the full scrape", failures)
+            check(not os.path.exists(f"{output_path}.partial") and not os.path.exists(f"{output_path}.checkpoint"),
+                  "the partial and checkpoint files are removed", failures)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if failures:
+        print(f"{len(failures)} checks failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,34 +3,110 @@ import json
 import os
 from datetime import date
 import sys
+import codecs
+import hashlib
+import argparse
+import itertools
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Allow running as `python scripts/get_course_data.py` from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import term_key
+
+SOC_URL = "https://classes.rutgers.edu/soc/api/courses.json"
+
+# Terms in calendar order (1 Spring, 7 Summer, 9 Fall) and the campuses the SOC serves
+TERMS = (1, 7, 9)
+CAMPUSES = ('NB', 'NK', 'CM')
+
+# Bytes read from a response or file at a time while streaming
+CHUNK_SIZE = 1 << 16
+
+# Characters skipped between the elements of a streamed JSON array
+JSON_SEPARATORS = ' \t\r\n,'
+
+
+def iter_json_array(chunks):
+    """Parse a JSON array incrementally, yielding each element as soon as it is complete.
+
+    Only the element being parsed is buffered, so a large response is never held in memory at once.
+
+    Args:
+        chunks (iterable): Byte chunks of a UTF-8 JSON document whose top level is an array.
+
+    Yields:
+        The elements of the array, in order.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    started = False
+
+    for chunk in itertools.chain(chunks, [None]):
+        final = chunk is None
+        buffer += utf8.decode(b'' if final else chunk, final)
+        pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in JSON_SEPARATORS:
+                pos += 1
+            if pos == len(buffer):
+                break
+
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(buffer) and not final:
+                break
+
+            yield element
+            pos = end
+
+        buffer = buffer[pos:]
+
+    raise ValueError("JSON array is not terminated")
+
 
 def get_current_semester():
     """Determine the current semester based on the current date.
 
-    Check if next semester data is available early (in March or October). 
+    Check if next semester data is available early (in March or October).
     If not, fall back to the current semester.
     """
     current_date = date.today()
     current_year = current_date.year
     current_month = current_date.month
 
-    
+
     def term_exists(year, term):
         """Check if course data exists for a given year/term without downloading all data."""
-        url = "https://classes.rutgers.edu/soc/api/courses.json"
         params = {'year': year, 'term': term, 'campus': 'NB'}
-        
-        try:
-            # Make a HEAD request to check if data exists without downloading
-            response = requests.head(url, params=params, timeout=10)
-            if response.status_code == 200:
 
-                # If HEAD works, make a quick GET to check if we get actual data
-                response = requests.get(url, params=params, timeout=10)
+        try:
+            # Stream the response and stop at the first course instead of downloading the whole term
+            with requests.get(SOC_URL, params=params, stream=True, timeout=10) as response:
                 response.raise_for_status()
-                courses = response.json()
-                return len(courses) > 0
-            return False
+                for _ in iter_json_array(response.iter_content(CHUNK_SIZE)):
+                    return True
+                return False
         except Exception as e:
             print(f"Could not check availability for {year} Term {term}: {e}")
             return False
@@ -67,52 +143,319 @@ def get_current_semester():
         return current_year, 9  # Fall
 
 
-def fetch_rutgers_courses(year, term, campus="NB"):
-    """Fetch course data from Rutgers API."""
-    
-    url = "https://classes.rutgers.edu/soc/api/courses.json"
-    params = {'year': year, 'term': term, 'campus': campus}
-    
-    print(f"Fetching course data for {year} Term {term}...")
-    
+def course_hash(course):
+    """Hash a course's full content, independent of key order."""
+    content = json.dumps(course, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def file_signature(path):
+    """Return (mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def write_json_atomic(data, path):
+    """Write JSON to a temporary file and rename it over path."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def load_metadata(metadata_path):
+    """Load what the previous refresh recorded (validators and course hashes), or {} if there is none."""
     try:
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        courses = response.json()
-        print(f"Successfully fetched {len(courses)} courses")
-        return courses
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data: {e}")
-        sys.exit(1)
-
-def save_course_data(courses, output_path="data/rutgers_courses.json"):
-    """Save course data to JSON file."""
-    
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def previous_course_hashes(output_path, metadata):
+    """
+    Get the course hashes of the current data file.
+
+    Uses the hashes recorded by the last refresh if the file has not changed since, and
+    otherwise streams through the file to compute them.
+
+    Args:
+        output_path (str): Path of the course data file.
+        metadata (dict): Metadata recorded by the last refresh.
+
+    Returns:
+        dict: Mapping of course strings to content hashes, empty if there is no data file.
+    """
+    signature = file_signature(output_path)
+    if signature is None:
+        return {}
+    if metadata.get('file') == signature and 'hashes' in metadata:
+        return metadata['hashes']
+
+    hashes = {}
+    with open(output_path, 'rb') as f:
+        for course in iter_json_array(iter(lambda: f.read(CHUNK_SIZE), b'')):
+            hashes[course.get('courseString')] = course_hash(course)
+    return hashes
+
+
+def fetch_rutgers_courses(year, term, campus="NB", output_path="data/rutgers_courses.json", force=False):
+    """Fetch course data from Rutgers API, streaming it into the data file, and report what changed.
+
+    Sends the ETag and Last-Modified of the previous download so an unchanged term costs a 304.
+    Courses are parsed and written one at a time to a temporary file that replaces the data
+    file atomically, and only if some course was added, changed or removed. The per-course diff
+    is written next to the data file as <name>.diff.json.
+
+    Args:
+        year (int): Year of the term.
+        term (int): Term number (1 Spring, 7 Summer, 9 Fall).
+        campus (str, optional): Campus code. Defaults to "NB".
+        output_path (str, optional): Path of the course data file. Defaults to "data/rutgers_courses.json".
+        force (bool, optional): Download without conditional headers. Defaults to False.
+
+    Returns:
+        dict: The diff (added, changed and removed course strings and the unchanged count),
+            or None if the server reported the data unchanged.
+
+    Raises:
+        requests.exceptions.RequestException: If the download failed.
+        ValueError: If the response is not a JSON array or holds no courses.
+    """
+    base_path = os.path.splitext(output_path)[0]
+    metadata_path = f"{base_path}.meta.json"
+    diff_path = f"{base_path}.diff.json"
+    temp_path = f"{output_path}.tmp"
+
+    params = {'year': year, 'term': term, 'campus': campus}
+    metadata = load_metadata(metadata_path)
+
+    # Conditional request, only valid for the same term and while the file we downloaded is still there
+    headers = {}
+    same_source = metadata.get('params') == params and metadata.get('file') == file_signature(output_path)
+    if same_source and not force:
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+
+    print(f"Fetching course data for {year} Term {term} ({campus})...")
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    hashes = {}
+    count = 0
+
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(courses, f, indent=2, ensure_ascii=False)
-        print(f"Saved {len(courses)} courses to {output_path}")
-        
-    except Exception as e:
-        print(f"Error saving data: {e}")
-        sys.exit(1)
+        with requests.get(SOC_URL, params=params, headers=headers, stream=True, timeout=30) as response:
+            if response.status_code == 304:
+                print("Course data is unchanged since the last download")
+                return None
+            response.raise_for_status()
+
+            # Same layout as json.dump(courses, f, indent=2), written one course at a time
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write('[')
+                for course in iter_json_array(response.iter_content(CHUNK_SIZE)):
+                    f.write(',\n' if count else '\n')
+                    f.write(textwrap.indent(json.dumps(course, indent=2, ensure_ascii=False), '  '))
+                    hashes[course.get('courseString')] = course_hash(course)
+                    count += 1
+                f.write('\n]' if count else ']')
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+    except (requests.exceptions.RequestException, ValueError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    print(f"Successfully fetched {count} courses for {year} Term {term} ({campus})")
+
+    if not count:
+        # Never replace good data with an empty term
+        os.remove(temp_path)
+        raise ValueError(f"No courses returned for {year} Term {term} ({campus}), keeping the existing course data")
+
+    previous = previous_course_hashes(output_path, metadata)
+    diff = {
+        'params': params,
+        'added': [code for code in hashes if code not in previous],
+        'changed': [code for code in hashes if code in previous and previous[code] != hashes[code]],
+        'removed': [code for code in previous if code not in hashes],
+    }
+    diff['unchanged'] = len(hashes) - len(diff['added']) - len(diff['changed'])
+
+    # Leave the data file untouched when nothing changed, so the app and index builds don't reload it
+    if diff['added'] or diff['changed'] or diff['removed'] or file_signature(output_path) is None:
+        os.replace(temp_path, output_path)
+        print(f"Saved {count} courses to {output_path}")
+    else:
+        os.remove(temp_path)
+        print(f"No course changes, kept {output_path}")
+
+    print(f"{output_path}: {len(diff['added'])} added, {len(diff['changed'])} changed, "
+          f"{len(diff['removed'])} removed, {diff['unchanged']} unchanged")
+
+    write_json_atomic(diff, diff_path)
+    write_json_atomic({
+        'params': params,
+        'etag': etag,
+        'last_modified': last_modified,
+        'file': file_signature(output_path),
+        'hashes': hashes
+    }, metadata_path)
+
+    return diff
+
+
+def adjacent_terms(year, term, before=0, after=0):
+    """
+    List a term together with the terms around it, in calendar order.
+
+    Args:
+        year (int): Year of the term.
+        term (int): Term number (1 Spring, 7 Summer, 9 Fall).
+        before (int, optional): Number of earlier terms to include. Defaults to 0.
+        after (int, optional): Number of later terms to include. Defaults to 0.
+
+    Returns:
+        list: (year, term) tuples.
+    """
+    position = year * len(TERMS) + TERMS.index(term)
+    return [
+        (p // len(TERMS), TERMS[p % len(TERMS)])
+        for p in range(position - before, position + after + 1)
+    ]
+
+
+def fetch_with_retry(year, term, campus, output_path, force=False, max_retries=3, base_delay=2.0):
+    """
+    Fetch one term and campus, retrying connection errors, timeouts and 5xx responses with backoff.
+
+    Args:
+        year (int): Year of the term.
+        term (int): Term number.
+        campus (str): Campus code.
+        output_path (str): Path of the course data file.
+        force (bool, optional): Download without conditional headers. Defaults to False.
+        max_retries (int, optional): Retries after the first attempt. Defaults to 3.
+        base_delay (float, optional): Seconds before the first retry, doubled each time. Defaults to 2.0.
+
+    Returns:
+        dict: The diff returned by fetch_rutgers_courses, or None if unchanged.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fetch_rutgers_courses(year, term, campus, output_path=output_path, force=force)
+        except requests.exceptions.RequestException as e:
+            response = getattr(e, 'response', None)
+            retryable = response is None or response.status_code == 429 or response.status_code >= 500
+            if attempt == max_retries or not retryable:
+                raise
+            delay = base_delay * 2 ** attempt
+            print(f"Retrying {year} Term {term} ({campus}) in {delay:.0f}s after error: {e}")
+            time.sleep(delay)
+
+
+def fetch_course_shards(terms, campuses, shard_dir='data/terms', primary=None, primary_path=None,
+                        max_workers=4, max_retries=3, force=False):
+    """
+    Fetch several campus/term combinations concurrently, one course data shard per combination.
+
+    Each shard is written to <shard_dir>/<year>-<term>-<campus>.json (the name the app's term
+    parameter uses) with its own conditional request, diff and metadata. At most max_workers
+    downloads run at once; each is streamed, so memory stays flat however many shards there are.
+
+    Args:
+        terms (list): (year, term) tuples to fetch.
+        campuses (list): Campus codes to fetch for every term.
+        shard_dir (str, optional): Directory of the shards. Defaults to 'data/terms'.
+        primary (tuple, optional): (year, term, campus) written to primary_path instead of a shard,
+            so the app's default course data is refreshed without downloading it twice.
+        primary_path (str, optional): Path of the default course data file.
+        max_workers (int, optional): Maximum number of downloads in flight. Defaults to 4.
+        max_retries (int, optional): Retries per shard after the first attempt. Defaults to 3.
+        force (bool, optional): Download without conditional headers. Defaults to False.
+
+    Returns:
+        dict: Shard name mapped to its diff, None if unchanged, or the exception if it failed.
+    """
+    jobs = {}
+    for year, term in terms:
+        for campus in campuses:
+            if (year, term, campus) == primary:
+                output_path = primary_path
+            else:
+                output_path = os.path.join(shard_dir, f"{term_key(year, term, campus)}.json")
+            jobs[term_key(year, term, campus)] = (year, term, campus, output_path)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="course-fetch") as executor:
+        futures = {
+            name: executor.submit(fetch_with_retry, *job, force=force, max_retries=max_retries)
+            for name, job in jobs.items()
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"Error fetching {name}: {e}")
+                results[name] = e
+
+    return results
+
 
 def main():
     """Main function to fetch and save course data."""
 
+    parser = argparse.ArgumentParser(description="Refresh the Rutgers course data")
+    parser.add_argument('--output', default='data/rutgers_courses.json')
+    parser.add_argument('--force', action='store_true', help="Download even if the server reports no change")
+    parser.add_argument('--campuses', default='NB',
+                        help=f"Comma-separated campuses to fetch into term shards, from {', '.join(CAMPUSES)}")
+    parser.add_argument('--terms-before', type=int, default=0, help="Also fetch this many earlier terms")
+    parser.add_argument('--terms-after', type=int, default=0, help="Also fetch this many later terms")
+    parser.add_argument('--shard-dir', default='data/terms')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv("FETCH_CONCURRENCY", 4)))
+    parser.add_argument('--max-retries', type=int, default=3)
+    args = parser.parse_args()
+
+    campuses = [campus.strip().upper() for campus in args.campuses.split(',') if campus.strip()]
+    unknown = [campus for campus in campuses if campus not in CAMPUSES]
+    if unknown:
+        parser.error(f"Unknown campus: {', '.join(unknown)}")
+
     # check if the current semester is available
     year, term = get_current_semester()
 
-    # fetch the course data
-    courses = fetch_rutgers_courses(year, term)
+    # fetch the course data, saving it if anything changed
+    if campuses == ['NB'] and not args.terms_before and not args.terms_after:
+        try:
+            fetch_with_retry(year, term, 'NB', args.output, force=args.force, max_retries=args.max_retries)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error fetching data: {e}")
+            sys.exit(1)
+    else:
+        # The current New Brunswick term stays in the default data file; everything else goes to shards
+        results = fetch_course_shards(
+            adjacent_terms(year, term, args.terms_before, args.terms_after), campuses,
+            shard_dir=args.shard_dir, primary=(year, term, 'NB'), primary_path=args.output,
+            max_workers=args.concurrency, max_retries=args.max_retries, force=args.force
+        )
+        failed = [name for name, result in results.items() if isinstance(result, Exception)]
+        if failed:
+            print(f"Failed to fetch: {', '.join(failed)}")
+
+        # Adjacent terms may simply not be published yet, but every requested campus has a current term
+        current = [term_key(year, term, campus) for campus in campuses]
+        if failed and (len(failed) == len(results) or any(name in failed for name in current)):
+            sys.exit(1)
 
-    # save the course data
-    save_course_data(courses)
-    
     print("Course data update completed!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
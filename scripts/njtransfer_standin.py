@@ -0,0 +1,202 @@
+import argparse
+import html
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scrape_course_equivalencies import colleges, community_colleges, fixture_name
+
+# Saved results pages replayed by default
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'njtransfer')
+
+# Path of the selection page, as on njtransfer.org
+PAGE_PATH = '/artweb/chgri.cgi'
+
+EMPTY_RESULTS = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>NJTransfer - Course Equivalencies</title></head>
+<body>
+  <table class="table table-striped">
+    <tr><th colspan="8">No equivalencies found</th></tr>
+    <tr><th>Course</th><th></th><th>Title</th><th>Credits</th><th></th><th>Equivalency</th><th>Title</th><th>Transfer Credit</th></tr>
+  </table>
+</body>
+</html>
+"""
+
+
+def options(names):
+    """Option tags with coded values, like the institution lists of the real page."""
+    return '\n'.join(f'      <option value="{index:04d}">{html.escape(name)}</option>' for index, name in enumerate(names))
+
+
+def selection_page():
+    """The institution selection form."""
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>NJTransfer - Select Institutions</title></head>
+<body>
+  <button type="button" class="acceptcookies">Accept</button>
+  <form method="post" action="chgri.cgi">
+    <select name="SIInst">
+{options(community_colleges)}
+    </select>
+    <select name="RIInst">
+{options(colleges)}
+    </select>
+    <input type="submit" name="SubChgRI" value="Continue">
+  </form>
+</body>
+</html>
+"""
+
+
+def course_page(sending, receiving, codes):
+    """The course selection form of a pair, one checkbox per course of its saved results page."""
+    checkboxes = '\n'.join(
+        f'    <label><input type="checkbox" name="crs" value="{html.escape(code)}"> {html.escape(code)}</label>'
+        for code in codes)
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>NJTransfer - Select Courses</title></head>
+<body>
+  <form method="post" action="chgri.cgi">
+    <input type="hidden" name="SIInst" value="{sending}">
+    <input type="hidden" name="RIInst" value="{receiving}">
+    <button type="button" class="btn btn-round btn-warning btn-sm shadow-none"
+            onclick="document.querySelectorAll('input[name=crs]').forEach(function (box) {{ box.checked = true; }})">List all</button>
+{checkboxes}
+    <input type="submit" name="doSearch" value="Search">
+  </form>
+</body>
+</html>
+"""
+
+
+class standin_state:
+    """
+    Saved pages and request bookkeeping shared by the handler threads.
+
+    Attributes:
+        fixtures_dir (str): Directory of the saved results pages
+        fail_pairs (set): (community_college, college) pairs answered with a 503
+        searched (list): Pairs whose course selection was requested, in request order
+    """
+
+    def __init__(self, fixtures_dir):
+        self.fixtures_dir = fixtures_dir
+        self.fail_pairs = set()
+        self.searched = []
+        self.lock = threading.Lock()
+
+    def results(self, pair):
+        """The saved results page of a pair, or an empty results table when none was saved."""
+        path = os.path.join(self.fixtures_dir, fixture_name(*pair))
+        if not os.path.exists(path):
+            return EMPTY_RESULTS
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def course_codes(self, pair):
+        """Course codes listed on the saved results page of a pair."""
+        soup = BeautifulSoup(self.results(pair), 'html.parser')
+        return [row.find('a').get_text(strip=True) for row in soup.find_all('tr')[2:]
+                if len(row.find_all('td')) >= 8 and row.find('a')]
+
+
+class standin_handler(BaseHTTPRequestHandler):
+    """Serves the selection, course and results pages of the NJTransfer course equivalency search."""
+
+    server_version = 'NJTransferStandIn/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_page(self, body, status=200):
+        encoded = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.send_header('Set-Cookie', 'sid=standin; Path=/')
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != PAGE_PATH:
+            self.send_page('Not found', 404)
+            return
+        self.send_page(selection_page())
+
+    def do_POST(self):
+        if urlsplit(self.path).path != PAGE_PATH:
+            self.send_page('Not found', 404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        fields = parse_qsl(self.rfile.read(length).decode('utf-8'), keep_blank_values=True)
+        values = dict(fields)
+        state = self.server.state
+
+        try:
+            pair = (community_colleges[int(values['SIInst'])], colleges[int(values['RIInst'])])
+        except (KeyError, ValueError, IndexError):
+            self.send_page('Unknown institution', 400)
+            return
+
+        if 'SubChgRI' in values:
+            with state.lock:
+                state.searched.append(pair)
+                failing = pair in state.fail_pairs
+            if failing:
+                self.send_page('Service unavailable', 503)
+                return
+            self.send_page(course_page(values['SIInst'], values['RIInst'], state.course_codes(pair)))
+        elif 'doSearch' in values:
+            ticked = [value for name, value in fields if name == 'crs']
+            self.send_page(state.results(pair) if ticked else EMPTY_RESULTS)
+        else:
+            self.send_page('Unknown form', 400)
+
+
+def make_server(fixtures_dir=FIXTURES_DIR, port=0):
+    """
+    Create a stand-in server replaying saved results pages.
+
+    Args:
+        fixtures_dir (str, optional): Directory of the saved results pages. Defaults to FIXTURES_DIR.
+        port (int, optional): Port to listen on, 0 for any free port. Defaults to 0.
+
+    Returns:
+        ThreadingHTTPServer: The server, with its standin_state as server.state.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), standin_handler)
+    server.daemon_threads = True
+    server.state = standin_state(fixtures_dir)
+    return server
+
+
+def main():
+    """Serve the saved pages until interrupted."""
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the NJTransfer equivalency search")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help="Directory of pages saved with --save-html")
+    args = parser.parse_args()
+
+    server = make_server(args.fixtures, args.port)
+    print(f"Serving {args.fixtures} at http://127.0.0.1:{server.server_address[1]}{PAGE_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,62 @@
+import argparse
+import csv
+import io
+import json
 import os
+import re
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
+
+import requests
 from bs4 import BeautifulSoup
-import pandas as pd
-from selenium.webdriver.support.ui import Select
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Allow running as `python scripts/scrape_course_equivalencies.py` from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from equivalency_store import FIELDNAMES, equivalency_table
 
-# Initialize the browser
-driver = webdriver.Chrome()
+BASE_URL = 'https://njtransfer.org/artweb/chgri.cgi'
 
 community_colleges = ["Atlantic-Cape Community College", 'Bergen Community College', 'Brookdale Community College', 'Camden County College', 'County College of Morris', 'Essex County College', 'Hudson County Community College', 'Mercer County Community College', 'Middlesex College', 'Ocean County College', 'Passaic County Community College', 'Raritan Valley Community College', 'Rowan College at Burlington County', 'Rowan College of South Jersey - Cumberland Campus', 'Rowan College of South Jersey - Gloucester Campus', 'Salem Community College', 'Sussex County Community College', 'UCNJ Union College of Union County, NJ', 'Warren County Community College']
-                      
-colleges = ["Rutgers Business School - New Brunswick", "Rutgers-Edward Bloustein Sch of Planning & Policy", "Rutgers-Ernest Mario School of Pharmacy", "Rutgers-Mason Gross School of Arts", "Rutgers-School of Arts and Sciences", "Rutgers-School of Engineering", "Rutgers-School of Env Biological Sciences", "Rutgers-School of Management and Labor Relations", "Rutgers-School of Nursing"]
 
-# Initialize the browser
-driver = webdriver.Chrome()
+colleges = ["Rutgers Business School - New Brunswick", "Rutgers-Edward Bloustein Sch of Planning & Policy", "Rutgers-Ernest Mario School of Pharmacy", "Rutgers-Mason Gross School of Arts", "Rutgers-School of Arts and Sciences", "Rutgers-School of Engineering", "Rutgers-School of Env Biological Sciences", "Rutgers-School of Management and Labor Relations", "Rutgers-School of Nursing"]
 
-def get_classes(community_college, college):
-    
-    driver.get('https://njtransfer.org/artweb/chgri.cgi')
 
-    # Select the community college and college
-    community_colleges = Select(driver.find_element(By.NAME, "SIInst"))
-    community_colleges.select_by_visible_text(community_college)
+def csv_writer(f):
+    """CSV writer for equivalency rows, formatted like the pandas output the app was built on."""
+    return csv.DictWriter(f, fieldnames=FIELDNAMES, lineterminator='\n')
 
-    colleges = Select(driver.find_element(By.NAME, "RIInst"))
-    colleges.select_by_visible_text(college)
 
-    # Click the submit button
-    try:
-      cookies_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.CLASS_NAME, "acceptcookies")))
-      cookies_button.click()
-    except:
-      pass
+def fixture_name(community_college, college):
+    """File name a results page is saved under by --save-html, and replayed from by the stand-in."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', f"{community_college}__{college}") + '.html'
 
-    submit_button = driver.find_element(By.NAME, "SubChgRI")
-    submit_button.click()
 
-    list_all = driver.find_element(By.CLASS_NAME, "btn.btn-round.btn-warning.btn-sm.shadow-none")
-    list_all.click()
+def parse_courses(html, community_college, college):
+    """
+    Read the equivalency rows from a search results page.
 
-    search_button = driver.find_element(By.NAME, "doSearch")
-    search_button.click()
+    Args:
+        html (str): The results page.
+        community_college (str): Community college the page was searched for.
+        college (str): Rutgers school the page was searched for.
 
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
+    Returns:
+        list: One dictionary per course, with the FIELDNAMES keys.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
     rows = soup.find_all('tr')[2:]
 
     courses = []
     for course in rows:
         tds = course.find_all('td')
+        if len(tds) < 8 or tds[0].a is None:
+            continue
         courses.append({
             'community_college': community_college,
             'college': college,
@@ -65,24 +70,427 @@ def get_classes(community_college, college):
     return courses
 
 
-all_courses = []
+def form_data(form):
+    """
+    Collect the fields a browser would submit for a form, leaving out its submit buttons.
+
+    Args:
+        form (bs4.element.Tag): The form element.
+
+    Returns:
+        list: (name, value) pairs in document order.
+    """
+    data = []
+    for field in form.find_all(['input', 'select', 'textarea']):
+        name = field.get('name')
+        if not name or field.has_attr('disabled'):
+            continue
+
+        if field.name == 'select':
+            options = field.find_all('option')
+            selected = [option for option in options if option.has_attr('selected')]
+            if not selected and options and not field.has_attr('multiple'):
+                selected = options[:1]
+            data.extend((name, option.get('value', option.get_text())) for option in selected)
+        elif field.name == 'textarea':
+            data.append((name, field.get_text()))
+        else:
+            kind = (field.get('type') or 'text').lower()
+            if kind in ('submit', 'button', 'image', 'reset', 'file'):
+                continue
+            if kind in ('checkbox', 'radio') and not field.has_attr('checked'):
+                continue
+            data.append((name, field.get('value', 'on' if kind in ('checkbox', 'radio') else '')))
+    return data
+
+
+def select_option(form, data, name, text):
+    """
+    Choose the option of a select field by its visible text, like Select.select_by_visible_text.
+
+    Args:
+        form (bs4.element.Tag): The form holding the select field.
+        data (list): (name, value) pairs from form_data, updated in place.
+        name (str): Name of the select field.
+        text (str): Visible text of the option.
+
+    Raises:
+        ValueError: If the form has no such field or option.
+    """
+    select = form.find('select', attrs={'name': name})
+    option = None
+    if select is not None:
+        option = next((o for o in select.find_all('option') if o.get_text(strip=True) == text), None)
+    if option is None:
+        raise ValueError(f"No option '{text}' for {name}")
+
+    data[:] = [(key, value) for key, value in data if key != name]
+    data.append((name, option.get('value', option.get_text())))
+
+
+class http_scraper:
+    """
+    Scrape equivalencies with plain HTTP form submissions instead of a browser.
+
+    Replays the same steps as the browser: choose the two institutions, submit, list all courses
+    and search. Each worker thread has its own session (the site tracks the form state per
+    visitor), with pooled keep-alive connections and retries for connection errors and 5xx.
+
+    Attributes:
+        base_url (str): URL of the institution selection page
+        timeout (float): Seconds allowed per request
+        save_html (str): Directory to save each results page in, or None
+        sessions (list): Every session created, so close() can close them
+    """
 
-# Loop through all the community colleges and colleges
-for community_college in community_colleges:
-    for college in colleges:
-        courses = get_classes(community_college, college)
-        if courses:
-            all_courses.extend(courses)
-            print(f"Got {len(courses)} courses for {community_college} and {college}")
+    def __init__(self, base_url=BASE_URL, timeout=30, max_retries=3, save_html=None):
+        """
+        Initialize the scraper. Sessions are created per worker thread on first use.
+
+        Args:
+            base_url (str, optional): URL of the institution selection page. Defaults to BASE_URL.
+            timeout (float, optional): Seconds allowed per request. Defaults to 30.
+            max_retries (int, optional): Retries for connection errors and 5xx responses. Defaults to 3.
+            save_html (str, optional): Directory to save each results page in, e.g. as test fixtures.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.save_html = save_html
+        self.local = threading.local()
+        self.sessions = []
+        self.lock = threading.Lock()
+
+    @property
+    def session(self):
+        """This thread's session."""
+        if getattr(self.local, 'session', None) is None:
+            session = requests.Session()
+            retry = Retry(total=self.max_retries, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=None)
+            session.mount('http://', HTTPAdapter(max_retries=retry))
+            session.mount('https://', HTTPAdapter(max_retries=retry))
+            with self.lock:
+                self.sessions.append(session)
+            self.local.session = session
+        return self.local.session
+
+    def submit(self, url, form, data):
+        """Submit a form the way a browser would and return the response page."""
+        action = urljoin(url, form.get('action') or url)
+        if (form.get('method') or 'get').lower() == 'post':
+            response = self.session.post(action, data=data, timeout=self.timeout)
         else:
-            print(f"Error getting courses for {community_college} and {college}")
+            response = self.session.get(action, params=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def get_classes(self, community_college, college):
+        """
+        Get the equivalencies between a community college and a Rutgers school.
+
+        Args:
+            community_college (str): Visible name of the community college.
+            college (str): Visible name of the Rutgers school.
+
+        Returns:
+            list: One dictionary per course, with the FIELDNAMES keys.
+        """
+        response = self.session.get(self.base_url, timeout=self.timeout)
+        response.raise_for_status()
+
+        # Select the community college and college
+        soup = BeautifulSoup(response.text, 'html.parser')
+        select = soup.find('select', attrs={'name': 'SIInst'})
+        if select is None:
+            raise ValueError("Institution selection form not found")
+        form = select.find_parent('form')
+        data = form_data(form)
+        select_option(form, data, 'SIInst', community_college)
+        select_option(form, data, 'RIInst', college)
+        data.append(('SubChgRI', form.find(attrs={'name': 'SubChgRI'}).get('value', '')))
+        response = self.submit(response.url, form, data)
+
+        # "List all" ticks every course of the agreement before searching
+        soup = BeautifulSoup(response.text, 'html.parser')
+        search_button = soup.find(attrs={'name': 'doSearch'})
+        if search_button is None:
+            raise ValueError("Course search form not found")
+        form = search_button.find_parent('form')
+        data = form_data(form)
+        for checkbox in form.find_all('input', attrs={'type': re.compile('^checkbox$', re.I)}):
+            if checkbox.get('name') and not checkbox.has_attr('checked') and not checkbox.has_attr('disabled'):
+                data.append((checkbox['name'], checkbox.get('value', 'on')))
+        data.append(('doSearch', search_button.get('value', '')))
+        response = self.submit(response.url, form, data)
+
+        if self.save_html:
+            os.makedirs(self.save_html, exist_ok=True)
+            with open(os.path.join(self.save_html, fixture_name(community_college, college)), 'w', encoding='utf-8') as f:
+                f.write(response.text)
+
+        return parse_courses(response.text, community_college, college)
+
+    def close(self):
+        """Close every session and its pooled connections."""
+        for session in self.sessions:
+            session.close()
+        self.sessions = []
+
+
+class browser_scraper:
+    """
+    Scrape equivalencies with a pool of Chrome instances, one per worker thread.
+
+    Attributes:
+        base_url (str): URL of the institution selection page
+        headless (bool): Run Chrome without a window
+        drivers (list): Every driver started, so close() can quit them
+    """
+
+    def __init__(self, base_url=BASE_URL, headless=True):
+        """
+        Initialize the pool. Each worker thread starts its own Chrome on first use.
+
+        Args:
+            base_url (str, optional): URL of the institution selection page. Defaults to BASE_URL.
+            headless (bool, optional): Run Chrome without a window. Defaults to True.
+        """
+        self.base_url = base_url
+        self.headless = headless
+        self.local = threading.local()
+        self.drivers = []
+        self.lock = threading.Lock()
+
+    @property
+    def driver(self):
+        """This thread's browser."""
+        if getattr(self.local, 'driver', None) is None:
+            from selenium import webdriver
+
+            options = webdriver.ChromeOptions()
+            if self.headless:
+                options.add_argument('--headless=new')
+            driver = webdriver.Chrome(options=options)
+            with self.lock:
+                self.drivers.append(driver)
+            self.local.driver = driver
+        return self.local.driver
+
+    def get_classes(self, community_college, college):
+        """
+        Get the equivalencies between a community college and a Rutgers school.
 
-# Save the data to a CSV file
-df = pd.DataFrame(all_courses)
-df.to_csv('community_to_college.csv', index=False)
+        Args:
+            community_college (str): Visible name of the community college.
+            college (str): Visible name of the Rutgers school.
 
-driver.quit()
+        Returns:
+            list: One dictionary per course, with the FIELDNAMES keys.
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import Select, WebDriverWait
+
+        driver = self.driver
+        driver.get(self.base_url)
+
+        # Select the community college and college
+        Select(driver.find_element(By.NAME, "SIInst")).select_by_visible_text(community_college)
+        Select(driver.find_element(By.NAME, "RIInst")).select_by_visible_text(college)
+
+        # Click the submit button
+        try:
+            cookies_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.CLASS_NAME, "acceptcookies")))
+            cookies_button.click()
+        except Exception:
+            pass
+
+        driver.find_element(By.NAME, "SubChgRI").click()
+        driver.find_element(By.CLASS_NAME, "btn.btn-round.btn-warning.btn-sm.shadow-none").click()
+        driver.find_element(By.NAME, "doSearch").click()
+
+        return parse_courses(driver.page_source, community_college, college)
+
+    def close(self):
+        """Quit every browser in the pool."""
+        for driver in self.drivers:
+            driver.quit()
+        self.drivers = []
+
+
+def load_checkpoint(checkpoint_path, partial_path):
+    """
+    Read which pairs an interrupted run finished, and drop rows written after the last of them.
+
+    Args:
+        checkpoint_path (str): Path of the checkpoint file, one JSON line per finished pair.
+        partial_path (str): Path of the CSV the rows are streamed to.
+
+    Returns:
+        dict: (community_college, college) mapped to its checkpoint entry (byte range and row count).
+    """
+    done = {}
+    if os.path.exists(checkpoint_path) and os.path.exists(partial_path):
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut off by the interruption
+                    break
+                done[(entry['community_college'], entry['college'])] = entry
+
+    end = max((entry['end'] for entry in done.values()), default=0)
+    if end == 0:
+        # Nothing to resume: start both files over
+        with open(partial_path, 'w', newline='', encoding='utf-8') as f:
+            csv_writer(f).writeheader()
+        open(checkpoint_path, 'w').close()
+        return {}
+
+    # Rows of a pair that was being written when the run stopped are not checkpointed
+    with open(partial_path, 'r+b') as f:
+        f.truncate(end)
+
+    # Drop a cut-off last line so new entries start on a line of their own
+    with open(checkpoint_path, 'w', encoding='utf-8') as f:
+        for entry in done.values():
+            f.write(json.dumps(entry) + '\n')
+    return done
+
+
+def assemble_output(partial_path, output_path, pairs, done):
+    """
+    Write the final CSV with each pair's rows in pair order, copying byte ranges of the partial file.
+
+    Args:
+        partial_path (str): Path of the streamed CSV, rows in completion order.
+        output_path (str): Path of the final CSV.
+        pairs (list): (community_college, college) tuples in output order.
+        done (dict): Checkpoint entries by pair.
+    """
+    temp_path = f"{output_path}.tmp"
+    with open(partial_path, 'rb') as source, open(temp_path, 'wb') as target:
+        target.write(source.readline())
+        for pair in pairs:
+            entry = done[pair]
+            source.seek(entry['start'])
+            remaining = entry['end'] - entry['start']
+            while remaining:
+                chunk = source.read(min(remaining, 1 << 20))
+                target.write(chunk)
+                remaining -= len(chunk)
+    os.replace(temp_path, output_path)
+
+
+def scrape(scraper, output_path, pairs, workers=4):
+    """
+    Scrape every pair concurrently, streaming rows to disk and checkpointing each finished pair.
+
+    Rows go to <output>.partial as soon as a pair finishes, followed by a line in
+    <output>.checkpoint with the pair's byte range, so an interrupted run resumes with only the
+    unfinished pairs. Once every pair is done the rows are written to output_path in pair order
+    and the partial and checkpoint files are removed.
+
+    Args:
+        scraper (http_scraper or browser_scraper): Fetches the rows of one pair.
+        output_path (str): Path of the final CSV.
+        pairs (list): (community_college, college) tuples to scrape.
+        workers (int, optional): Number of pairs scraped at once. Defaults to 4.
+
+    Returns:
+        list: Pairs that failed; the output is only written when this is empty.
+    """
+    partial_path = f"{output_path}.partial"
+    checkpoint_path = f"{output_path}.checkpoint"
+
+    done = load_checkpoint(checkpoint_path, partial_path)
+    pending = [pair for pair in pairs if pair not in done]
+    if done:
+        print(f"Resuming: {len(pairs) - len(pending)} of {len(pairs)} pairs already scraped")
+
+    failed = []
+    with open(partial_path, 'ab') as partial, open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scraper") as executor:
+        futures = {executor.submit(scraper.get_classes, *pair): pair for pair in pending}
+
+        for future in as_completed(futures):
+            community_college, college = pair = futures[future]
+            try:
+                courses = future.result()
+            except Exception as e:
+                print(f"Error getting courses for {community_college} and {college}: {e}")
+                failed.append(pair)
+                continue
+
+            buffer = io.StringIO()
+            csv_writer(buffer).writerows(courses)
+
+            # Rows must be on disk before the checkpoint that covers them
+            start = partial.tell()
+            partial.write(buffer.getvalue().encode('utf-8'))
+            partial.flush()
+            os.fsync(partial.fileno())
+
+            entry = {'community_college': community_college, 'college': college,
+                     'rows': len(courses), 'start': start, 'end': partial.tell()}
+            checkpoint.write(json.dumps(entry) + '\n')
+            checkpoint.flush()
+            done[pair] = entry
+
+            if courses:
+                print(f"Got {len(courses)} courses for {community_college} and {college}")
+            else:
+                print(f"No courses for {community_college} and {college}")
+
+    if failed:
+        print(f"{len(failed)} pairs failed; run again to retry them")
+        return failed
+
+    assemble_output(partial_path, output_path, pairs, done)
+    os.remove(partial_path)
+    os.remove(checkpoint_path)
+    print(f"Saved {sum(done[pair]['rows'] for pair in pairs)} equivalencies to {output_path}")
+    return failed
+
+
+def main():
+    """Scrape the equivalencies of every community college and Rutgers school pair."""
+
+    parser = argparse.ArgumentParser(description="Scrape community college to Rutgers course equivalencies")
+    parser.add_argument('--output', default='community_to_college.csv')
+    parser.add_argument('--mode', choices=('http', 'browser'), default='http',
+                        help="Submit the forms over HTTP, or drive a pool of Chrome instances")
+    parser.add_argument('--workers', type=int, default=4, help="Number of pairs scraped at once")
+    parser.add_argument('--base-url', default=BASE_URL, help="Selection page, e.g. a local stand-in serving saved pages")
+    parser.add_argument('--save-html', help="Directory to save each results page in (http mode)")
+    parser.add_argument('--show-browser', action='store_true', help="Run Chrome with a window (browser mode)")
+    args = parser.parse_args()
+
+    if args.mode == 'http':
+        scraper = http_scraper(args.base_url, save_html=args.save_html)
+    else:
+        scraper = browser_scraper(args.base_url, headless=not args.show_browser)
+
+    # Loop through all the community colleges and colleges
+    pairs = [(community_college, college) for community_college in community_colleges for college in colleges]
+
+    start = time.perf_counter()
+    try:
+        failed = scrape(scraper, args.output, pairs, args.workers)
+    finally:
+        scraper.close()
+    print(f"Finished in {time.perf_counter() - start:.1f}s")
 
+    if failed:
+        raise SystemExit(1)
 
+    # The typed, columnar form the app loads instead of parsing the CSV
+    store_path = os.path.splitext(args.output)[0] + '.npz'
+    equivalency_table.from_csv(args.output).save(store_path)
+    print(f"Saved equivalency store to {store_path}")
 
 
+if __name__ == "__main__":
+    main()
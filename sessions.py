@@ -0,0 +1,129 @@
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class session_store:
+    """
+    In-memory store of per-user location sessions with sliding expiry.
+
+    A session holds the user's location grid cell and the distance table computed for it,
+    so each request reuses its own distances instead of sharing module-level state.
+
+    Session tokens embed the grid cell and the time they were issued, signed with an HMAC
+    ("<random>.<row>.<column>.<issued>.<signature>"), so a gunicorn worker that has not seen a
+    token can still rebuild the session from the shared distance cache. Only tokens this app
+    issued within the last ttl seconds are rebuilt; forged, altered and expired ones are not.
+
+    Attributes:
+        ttl (float): Seconds of inactivity before a session expires
+        max_size (int): Maximum number of sessions kept; the least recently used are dropped first
+    """
+
+    def __init__(self, ttl=86400, max_size=10000, secret=None):
+        """
+        Initialize the store.
+
+        Args:
+            ttl (float, optional): Seconds of inactivity before a session expires. Defaults to 86400.
+            max_size (int, optional): Maximum number of sessions kept. Defaults to 10000.
+            secret (str, optional): Key that signs session tokens; every worker must use the same one.
+                Defaults to a random key, which workers forked from a preloaded app share.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.secret = secret.encode('utf-8') if secret else secrets.token_bytes(32)
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def new_token(self, cell):
+        """
+        Create a signed session token for a location grid cell.
+
+        Args:
+            cell (tuple): Integer (row, column) of the grid cell.
+
+        Returns:
+            str: A new random token that embeds the cell and the time it was issued.
+        """
+        payload = f"{secrets.token_urlsafe(16)}.{cell[0]}.{cell[1]}.{int(time.time())}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def token_cell(self, token):
+        """
+        Read the location grid cell embedded in a session token, after checking its signature and age.
+
+        Args:
+            token (str): A session token.
+
+        Returns:
+            tuple: Integer (row, column) of the grid cell, or None if the token is malformed,
+                not signed by this app, or older than the session ttl.
+        """
+        try:
+            payload, signature = token.rsplit('.', 1)
+            _, row, column, issued = payload.rsplit('.', 3)
+            cell = (int(row), int(column))
+            issued = int(issued)
+        except (AttributeError, ValueError):
+            return None
+
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        if time.time() - issued > self.ttl:
+            return None
+        return cell
+
+    def get(self, token):
+        """
+        Look up a session and extend its expiry.
+
+        Args:
+            token (str): A session token.
+
+        Returns:
+            dict: The session data, or None if it does not exist or has expired.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.sessions.get(token)
+            if entry is None:
+                return None
+
+            expires, data = entry
+            if expires < now:
+                del self.sessions[token]
+                return None
+
+            self.sessions[token] = (now + self.ttl, data)
+            self.sessions.move_to_end(token)
+            return data
+
+    def set(self, token, data):
+        """
+        Create or replace a session.
+
+        Args:
+            token (str): A session token.
+            data (dict): The session data.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.sessions[token] = (now + self.ttl, data)
+            self.sessions.move_to_end(token)
+
+            # Sessions are ordered by last use, so expired ones are at the front
+            while self.sessions:
+                oldest_token, (expires, _) = next(iter(self.sessions.items()))
+                if expires >= now and len(self.sessions) <= self.max_size:
+                    break
+                del self.sessions[oldest_token]
+
+    def __len__(self):
+        return len(self.sessions)
@@ -80,11 +80,14 @@ function search() {
             endpoint = '/search_by_title';
     }
 
+    // Course searches use GET so the browser can revalidate cached responses with their ETag
+    const useGet = currentSearchType === 'title' || currentSearchType === 'code';
+
     $.ajax({
         url: endpoint,
-        method: 'POST',
-        contentType: 'application/json',
-        data: JSON.stringify({ searchTerm: searchTerm }),
+        method: useGet ? 'GET' : 'POST',
+        contentType: useGet ? undefined : 'application/json',
+        data: useGet ? { searchTerm: searchTerm } : JSON.stringify({ searchTerm: searchTerm }),
         success: function(data) {
         if (data.status === 'error') {
                 const $resultsContainer = $('#search-results');
@@ -0,0 +1,128 @@
+import json
+import os
+
+import numpy as np
+
+
+class local_vector_index:
+    """
+    In-process cosine similarity search over course embeddings.
+
+    A drop-in replacement for the Pinecone index used by course_search. Embeddings are stored
+    L2-normalized in a float32 NumPy matrix so cosine similarity is a single matrix-vector product.
+
+    On disk an index is two files sharing a base path:
+        <path>.npy  - the normalized embedding matrix, one row per course
+        <path>.json - the course ids (course strings) and metadata for each row
+
+    Attributes:
+        ids (list): Course ids, aligned with the rows of vectors
+        metadata (list): Metadata dictionaries, aligned with the rows of vectors
+        vectors (numpy.ndarray): Normalized embedding matrix of shape (n, dimension)
+    """
+
+    def __init__(self, ids, vectors, metadata=None):
+        """
+        Initialize the index from already normalized vectors.
+
+        Args:
+            ids (list): Course ids, one per row of vectors.
+            vectors (numpy.ndarray): Normalized embedding matrix.
+            metadata (list, optional): Metadata dictionaries, one per row of vectors.
+        """
+        self.ids = ids
+        self.vectors = vectors
+        self.metadata = metadata if metadata is not None else [{} for _ in ids]
+
+    @staticmethod
+    def normalize(vectors):
+        """
+        L2-normalize embeddings row-wise, leaving all-zero rows as zeros.
+
+        Args:
+            vectors (array-like): A single embedding or a matrix of embeddings.
+
+        Returns:
+            numpy.ndarray: float32 array with unit-length rows.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    @classmethod
+    def save(cls, path, ids, vectors, metadata=None):
+        """
+        Normalize embeddings and write them to disk.
+
+        Each file is written to a temporary name and renamed into place, the matrix last,
+        so a running app that reloads on a change of the .npy file never reads a partial index.
+
+        Args:
+            path (str): Base path of the index files, without extension.
+            ids (list): Course ids, one per embedding.
+            vectors (array-like): Embeddings of shape (n, dimension).
+            metadata (list, optional): Metadata dictionaries, one per embedding.
+        """
+        with open(f"{path}.json.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'ids': list(ids), 'metadata': metadata}, f)
+        with open(f"{path}.npy.tmp", 'wb') as f:
+            np.save(f, cls.normalize(vectors))
+
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+        os.replace(f"{path}.npy.tmp", f"{path}.npy")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index written by save, memory-mapping the embedding matrix.
+
+        Args:
+            path (str): Base path of the index files, without extension.
+
+        Returns:
+            local_vector_index: The loaded index.
+        """
+        vectors = np.load(f"{path}.npy", mmap_mode='r')
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if len(data['ids']) != vectors.shape[0]:
+            raise ValueError(f"Vector index {path} has {vectors.shape[0]} vectors but {len(data['ids'])} ids")
+
+        return cls(data['ids'], vectors, data.get('metadata'))
+
+    def query(self, vector, top_k, include_metadata=True):
+        """
+        Find the stored embeddings most similar to a query embedding.
+
+        Mirrors the Pinecone query response so callers can use either backend.
+
+        Args:
+            vector (array-like): The query embedding.
+            top_k (int): The number of matches to return.
+            include_metadata (bool, optional): Include stored metadata in matches. Defaults to True.
+
+        Returns:
+            dict: {'matches': [{'id', 'score', 'metadata'}, ...]} sorted by descending cosine similarity.
+        """
+        query = self.normalize(vector)
+        k = min(top_k, len(self.ids))
+
+        # A zero query (failed embedding) has no meaningful neighbours
+        if k <= 0 or not query.any():
+            return {'matches': []}
+
+        scores = self.vectors @ query
+
+        # Select the top k in O(n), then sort only those k
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for i in top:
+            match = {'id': self.ids[i], 'score': float(scores[i])}
+            if include_metadata:
+                match['metadata'] = self.metadata[i] or {}
+            matches.append(match)
+
+        return {'matches': matches}